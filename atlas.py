@@ -0,0 +1,92 @@
+import argparse
+import hashlib
+import os
+import shutil
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def polarity2hue(polarity):
+    min = 0
+    max = 180 - 78
+    range = max - min
+    step = range / 18
+    step_polarity = 200 / 18
+    return (polarity + 100) / step_polarity * step / 360 #* 1.8/720
+
+
+class AvatarAtlas():
+    # Every polarity in [-100, 100] falls in one of `buckets` evenly spaced
+    # buckets and each bucket is rendered once to
+    # {cache_dir}/{avatar hash}-{buckets}/{bucket}.png. Changing avatar.png
+    # (or the number of buckets) points at a new directory, which is built
+    # on first use while the stale ones are removed.
+    def __init__(self, path='avatar.png', cache_dir='avatar_cache', buckets=18, polarity2hue=polarity2hue):
+        if buckets < 2:
+            raise ValueError('at least 2 buckets are needed')
+        self.path = path
+        self.cache_dir = cache_dir
+        self.buckets = buckets
+        self.polarity2hue = polarity2hue
+        self.key = f'{file_hash(path)[:16]}-{buckets}'
+        self.dir = os.path.join(cache_dir, self.key)
+
+    def bucket(self, polarity):
+        polarity = max(-100.0, min(100.0, float(polarity)))
+        return round((polarity + 100) / 200 * (self.buckets - 1))
+
+    def bucket_polarity(self, bucket):
+        return bucket * 200 / (self.buckets - 1) - 100
+
+    def hue(self, polarity):
+        return self.polarity2hue(self.bucket_polarity(self.bucket(polarity)))
+
+    def filename(self, bucket):
+        return os.path.join(self.dir, f'{bucket:03d}.png')
+
+    def is_built(self):
+        return os.path.exists(os.path.join(self.dir, 'complete'))
+
+    def build(self, force=False):
+        if self.is_built() and not force:
+            return False
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name != self.key:
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+        # numpy and PIL are only needed to render
+        import hue_shift
+        shifter = hue_shift.HueShifter(self.path)
+        for bucket in range(self.buckets):
+            hue = self.polarity2hue(self.bucket_polarity(bucket))
+            with open(self.filename(bucket), 'wb') as f:
+                f.write(shifter.render_png(hue).getvalue())
+        open(os.path.join(self.dir, 'complete'), 'w').close()
+        return True
+
+    def open(self, polarity):
+        self.build()
+        return open(self.filename(self.bucket(polarity)), 'rb')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-render the avatar for every polarity bucket')
+    parser.add_argument('--avatar', default='avatar.png')
+    parser.add_argument('--cache-dir', default='avatar_cache')
+    parser.add_argument('--buckets', type=int, default=int(os.environ.get('AVATAR_BUCKETS', 18)))
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args(argv)
+    atlas = AvatarAtlas(args.avatar, args.cache_dir, args.buckets)
+    built = atlas.build(force=args.force)
+    print(f'{atlas.dir} {"built" if built else "up to date"}')
+
+
+if __name__ == '__main__':
+    main()
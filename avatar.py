@@ -1,115 +1,101 @@
-import tweepy
+import argparse
 import os
-import re
-from textblob import TextBlob
-from textblob.exceptions import TranslatorError
 import time
-from datetime import datetime
-import requests
-import csv
+from datetime import datetime, timezone
 import json
-from PIL import Image
-import numpy as np
 
-from io import StringIO
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import config
+import normalizer
+import rolling
+import seen
+import timeline
+import tinybird
+import tweetjson
+import uploads
 
 
-TWITTER_HANDLE = 'alrocar'
+# numpy, PIL and textblob (scoring, stripes and the atlas build) and tweepy
+# are only imported by the functions that need them, so an hourly run
+# without new tweets and with unchanged stripes never loads them.
 
-CONSUMER_KEY = os.environ['CONSUMER_KEY']
-CONSUMER_SECRET = os.environ['CONSUMER_SECRET']
-ACCESS_TOKEN = os.environ['ACCESS_TOKEN']
-ACCESS_TOKEN_SECRET = os.environ['ACCESS_TOKEN_SECRET']
-TB_TOKEN = os.environ['TB_TOKEN']
-READ_TOKEN = os.environ['READ_TOKEN']
+TWITTER_HANDLE = 'alrocar'
 
 TB_API_URL = 'https://api.tinybird.co/v0'
+UPLOAD_CODEC = os.environ.get('TB_UPLOAD_CODEC')
+# the timeline uploads post a chunk every 1MB of rows while the run goes on;
+# its own setting, TB_CHUNK_BYTES is tinybird.CHUNK_BYTES for every other upload
+UPLOAD_CHUNK_BYTES = int(os.environ.get('TIMELINE_CHUNK_BYTES', 1024 * 1024))
 datasource = f'{TWITTER_HANDLE}_tweets'
 datasource_raw = f'{TWITTER_HANDLE}_tweets_raw'
+FORCE_UPLOAD = False
+POLARITY_SOURCE = os.environ.get('POLARITY_SOURCE', 'tinybird')
+CONTINUOUS_INTERVAL = int(os.environ.get('CONTINUOUS_INTERVAL', 300))
+_tb_client = None
+_upload_state = None
+_rolling_polarity = None
+_seen_ids = None
+_polarity_cache = None
+_avatar_atlas = None
+
+
+def get_tb_client():
+    global _tb_client
+    if _tb_client is None:
+        _tb_client = tinybird.get_client(TB_API_URL, pool_size=int(os.environ.get('TB_POOL_SIZE', 10)))
+    return _tb_client
+
+
+def get_upload_state():
+    global _upload_state
+    if _upload_state is None:
+        _upload_state = uploads.UploadState('upload_state.json')
+    return _upload_state
+
+
+def get_rolling_polarity():
+    # every scored tweet also feeds a local rolling aggregate; POLARITY_SOURCE=local
+    # reads the avatar polarity and the stripes from it instead of the pipes
+    global _rolling_polarity
+    if _rolling_polarity is None:
+        _rolling_polarity = rolling.RollingPolarity(path='rolling_polarity.json')
+    return _rolling_polarity
+
+
+def get_seen_ids():
+    # ids already scored and uploaded; a page overlapping an earlier one (a
+    # stale since_id, a retried run) only ingests the tweets not seen before
+    global _seen_ids
+    if _seen_ids is None:
+        _seen_ids = seen.SeenIds(max_age=int(os.environ.get('SEEN_IDS_MAX_AGE', 7 * 86400)), path='seen_ids.bin')
+    return _seen_ids
+
+
+def get_polarity_cache():
+    global _polarity_cache
+    if _polarity_cache is None:
+        import scoring
+        _polarity_cache = scoring.PolarityCache(path='polarity_cache.json')
+    return _polarity_cache
+
 
-auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-api = tweepy.API(auth, timeout=300)
-
-
-def rgb_to_hsv(rgb):
-    # Translated from source of colorsys.rgb_to_hsv
-    # r,g,b should be a numpy arrays with values between 0 and 255
-    # rgb_to_hsv returns an array of floats between 0.0 and 1.0.
-    rgb = rgb.astype('float')
-    hsv = np.zeros_like(rgb)
-    # in case an RGBA array was passed, just copy the A channel
-    hsv[..., 3:] = rgb[..., 3:]
-    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
-    maxc = np.max(rgb[..., :3], axis=-1)
-    minc = np.min(rgb[..., :3], axis=-1)
-    hsv[..., 2] = maxc
-    mask = maxc != minc
-    hsv[mask, 1] = (maxc - minc)[mask] / maxc[mask]
-    rc = np.zeros_like(r)
-    gc = np.zeros_like(g)
-    bc = np.zeros_like(b)
-    rc[mask] = (maxc - r)[mask] / (maxc - minc)[mask]
-    gc[mask] = (maxc - g)[mask] / (maxc - minc)[mask]
-    bc[mask] = (maxc - b)[mask] / (maxc - minc)[mask]
-    hsv[..., 0] = np.select(
-        [r == maxc, g == maxc], [bc - gc, 2.0 + rc - bc], default=4.0 + gc - rc)
-    hsv[..., 0] = (hsv[..., 0] / 6.0) % 1.0
-    return hsv
-
-
-def hsv_to_rgb(hsv):
-    # Translated from source of colorsys.hsv_to_rgb
-    # h,s should be a numpy arrays with values between 0.0 and 1.0
-    # v should be a numpy array with values between 0.0 and 255.0
-    # hsv_to_rgb returns an array of uints between 0 and 255.
-    rgb = np.empty_like(hsv)
-    rgb[..., 3:] = hsv[..., 3:]
-    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
-    i = (h * 6.0).astype('uint8')
-    f = (h * 6.0) - i
-    p = v * (1.0 - s)
-    q = v * (1.0 - s * f)
-    t = v * (1.0 - s * (1.0 - f))
-    i = i % 6
-    conditions = [s == 0.0, i == 1, i == 2, i == 3, i == 4, i == 5]
-    rgb[..., 0] = np.select(conditions, [v, q, p, p, t, v], default=v)
-    rgb[..., 1] = np.select(conditions, [v, v, v, q, p, p], default=t)
-    rgb[..., 2] = np.select(conditions, [v, p, t, v, v, q], default=p)
-    return rgb.astype('uint8')
-
-
-def shift_hue(arr, hout):
-    hsv = rgb_to_hsv(arr)
-    hsv[..., 0] = hout
-    rgb = hsv_to_rgb(hsv)
-    return rgb
-
-
-def get_requests_session():
-    retry = Retry(total=5, backoff_factor=10)
-    adapter = HTTPAdapter(max_retries=retry)
-    _session = requests.Session()
-    _session.mount('http://', adapter)
-    _session.mount('https://', adapter)
-    return _session
+def get_avatar_atlas():
+    global _avatar_atlas
+    if _avatar_atlas is None:
+        import atlas
+        _avatar_atlas = atlas.AvatarAtlas('avatar.png', 'avatar_cache', buckets=int(os.environ.get('AVATAR_BUCKETS', 18)))
+    return _avatar_atlas
 
 
 def get_last_tweet_id():
-    max_id_url = f'{TB_API_URL}/pipes/alrocar_timeline_max_id.json?token={READ_TOKEN}'
-    response = get_requests_session().get(max_id_url)
-    data = response.json()['data']
+    data = get_tb_client().query_pipe('alrocar_timeline_max_id', config.secret('READ_TOKEN'))
     if len(data) == 0:
         return
     return data[0]['since_id']
 
 
-def get_polarity_mvng_avg():
-    max_id_url = f'{TB_API_URL}/pipes/alrocar_timeline_moving_average.json?token={READ_TOKEN}'
-    response = get_requests_session().get(max_id_url)
-    data = response.json()['data']
+def get_polarity_mvng_avg(data=None):
+    if data is None:
+        data = get_tb_client().query_pipe('alrocar_timeline_moving_average', config.secret('READ_TOKEN'))
     if len(data) == 0:
         return
     return data
@@ -117,137 +103,203 @@ def get_polarity_mvng_avg():
 
 def get_tweets(since_id=None, user=None):
     # for page in tweepy.Cursor(api.user_timeline, id=TWITTER_HANDLE, count=200).pages(20):
-    raw = []
-    for page in tweepy.Cursor(api.home_timeline, since_id=since_id, count=200).pages(20):
-        for tweet in page:
-            raw.append(tweet)
-        time.sleep(65)
-    return raw
+    api = config.twitter_api()
+    fetcher = timeline.TimelineFetcher(timeline.tweepy_source(api, 'home_timeline'), since_id=since_id, pages=20, count=200)
+    return fetcher.pages()
+
+
+class TimelineTweet():
+    # What is kept of a timeline status once its raw JSON is in the upload
+    # buffer: a few hundred bytes instead of the Status object and its _json
+    __slots__ = ('id', 'date', 'text', 'polarity')
+
+    def __init__(self, id, date, text, polarity=None):
+        self.id = id
+        self.date = date
+        self.text = text
+        self.polarity = polarity
+
+    def row(self):
+        return [self.id, self.date, self.text, self.polarity]
 
 
 def parse_tweets(tweets):
-    result = []
-    for tweet in tweets:
-        tweetid = tweet.id
-        tweetdate = str(tweet.created_at)
-        tweettext = tweet.text
-        tt = " ".join(re.sub("([^0-9A-Za-z \t])|(\w+:\/\/\S+)", "", tweettext).split())
-        result.append([tweetid, tweetdate, tt])
-    return result
+    texts = normalizer.normalize_batch([tweet.text for tweet in tweets])
+    return [TimelineTweet(tweet.id, str(tweet.created_at), tt) for tweet, tt in zip(tweets, texts)]
 
 
 def enrich_polarity(tweet):
     try:
-        analysis = TextBlob(tweet)
-        #language = analysis.detect_language()
-        #if language != 'en':
-            #analysis = analysis.translate(to='en')
-        return round(analysis.sentiment.polarity, 4)
+        return get_polarity_cache().score(tweet)
     except Exception:
         pass
-    except TranslatorError:
-        pass
 
 
-def to_tinybird(rows, datasource_name, columns, token=TB_TOKEN, mode='append'):
-    url = f'{TB_API_URL}/datasources?mode={mode}&name={datasource_name}'
+def enrich_polarity_batch(tweets):
+    try:
+        return get_polarity_cache().score_batch(tweets)
+    except Exception:
+        return [enrich_polarity(tweet) for tweet in tweets]
 
-    csv_chunk = StringIO()
-    writer = csv.writer(csv_chunk, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
 
-    writer.writerow(columns)
-    for row in rows:
-        writer.writerow(row)
+def to_tinybird(rows, datasource_name, columns, token=None, mode='append', codec=UPLOAD_CODEC):
+    tinybird.to_tinybird(rows, datasource_name, columns, token or config.secret('TB_TOKEN'), mode=mode, endpoint=TB_API_URL, codec=codec)
 
-    data = csv_chunk.getvalue()
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'X-TB-Client': 'alrocar-tweets-0.1',
-    }
 
-    if data:
-        response = get_requests_session().post(url, headers=headers, files=dict(csv=data))
-        ok = response.status_code < 400
-        if not ok:
-            raise Exception(json.dumps(response.json()))
+def bulk_uploader(datasource_name, columns, token=None, mode='append', codec=UPLOAD_CODEC):
+    return tinybird.BulkUploader(datasource_name, columns, token or config.secret('TB_TOKEN'), mode=mode, endpoint=TB_API_URL, codec=codec,
+                                 chunk_bytes=UPLOAD_CHUNK_BYTES)
 
 
-def get_polarity():
-    polarity_url = f'{TB_API_URL}/pipes/alrocar_timeline_polarity.json?token={READ_TOKEN}'
-    response = get_requests_session().get(polarity_url)
-    data = response.json()['data']
+def get_polarity(data=None):
+    if data is None:
+        data = get_tb_client().query_pipe('alrocar_timeline_polarity', config.secret('READ_TOKEN'))
     if len(data) == 0 or data[0]['polarity'] is None:
         return
     return float(data[0]['polarity'])
 
 
-def polarity2hue(polarity):
-    min = 0
-    max = 180 - 78
-    range = max - min
-    step = range / 18
-    step_polarity = 200 / 18
-    return (polarity + 100) / step_polarity * step / 360 #* 1.8/720
-
-
 def update_avatar(hue, polarity):
-    img = Image.open('avatar.png').convert('RGBA')
-    arr = np.array(img)
-    new_img = Image.fromarray(shift_hue(arr, hue), 'RGBA')
-    avatar = f'_avatar{str(hue)}.png'
-    new_img.save(avatar)
-    api.update_profile_image(avatar)
+    with get_avatar_atlas().open(polarity) as avatar:
+        get_upload_state().upload('avatar', avatar, lambda f: config.twitter_api().update_profile_image(f'_avatar{str(hue)}.png', file_=f), force=FORCE_UPLOAD)
     to_tinybird([[str(datetime.now()), polarity, hue]], f'{TWITTER_HANDLE}_polarity_log', ["date", "polarity", "hue"])
 
 
 def update_header():
-    api.update_profile_banner('stripes.png')
+    with open('stripes.png', 'rb') as banner:
+        get_upload_state().upload('banner', banner, lambda f: config.twitter_api().update_profile_banner('stripes.png', file=f), force=FORCE_UPLOAD)
 
 
 def create_stripes(data):
-    stripes = Image.new(mode="RGB", size=(1500, 500))
-    i = 0
-    import math
-    for p in data:
-        img = Image.open('stripe.png').convert('RGBA')
-        aa = img.load()
-        # hues = [[103,0,13], [165,15,21], [203,24,29], [239,59,44], [251,106,74], [252,146,114], [252,187,161], [254,224,210], [255,245,240], [247,251,255], [222,235,247], [198,219,239], [158,202,225], [107,174,214], [66,146,198], [33,113,181], [8,81,156], [8,48,107]]       
-        hues = [[103,0,13], [165,15,21], [203,24,29], [239,59,44], [251,106,74], [252,146,114], [252,187,161], [254,224,210], [255,245,240], [247,252,245],[229,245,224],[199,233,192],[161,217,155],[116,196,118],[65,171,93],[35,139,69],[0,109,44],[0,68,27]]
-        # hues = [[222,45,38],[252,146,114],[254,224,210], [229,245,224], [161,217,155], [49,163,84]]
-        
-
-        data = np.array(img)
-
-        # r1, g1, b1 = 0, 0, 0 # Original value
-        r1 = aa[0, 0][0] # Original value
-        g1 = aa[0, 0][1] # Original value
-        b1 = aa[0, 0][2] # Original value
-        r2, g2, b2 = 255 - p['polarity'] + 100, 0 + p['polarity'] + 100, 0 # Value that we want to replace it with
-        hue = hues[math.floor((p['polarity'] + 100) / (200 / len(hues))) % len(hues)]
-        r2 = hue[0]
-        g2 = hue[1]
-        b2 = hue[2]
-
-        red, green, blue = data[:,:,0], data[:,:,1], data[:,:,2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data[:,:,:3][mask] = [r2, g2, b2]
-
-        new_img = Image.fromarray(data)
-        Image.Image.paste(stripes, new_img, (10 * i, 0))
-        i += 1
-    stripes.save('stripes.png')
-
-
-since_id = get_last_tweet_id()
-tweets_raw = get_tweets(since_id)
-tweets = [[tweet.id, str(tweet.created_at), " ".join(re.sub("([^0-9A-Za-z \t])|(\w+:\/\/\S+)", "", tweet.text).split())] for tweet in tweets_raw]
-to_tinybird([tweet + [enrich_polarity(tweet[2])] for tweet in tweets], datasource, ["id", "date", "text", "polarity"])
-to_tinybird([json.dumps(tweet._json) for tweet in tweets_raw], datasource_raw, ["tweet"])
-polarity = get_polarity()
-if polarity:
-    hue = polarity2hue(polarity)
-    update_avatar(hue, polarity)
-
-data = get_polarity_mvng_avg()
-create_stripes(data)
-update_header()
+    # returns whether the banner changed since the last run; the same rows
+    # as last time are recognised from their hash without loading numpy
+    rows = json.dumps(data, sort_keys=True).encode('utf-8')
+    if os.path.exists('stripes.png') and not get_upload_state().changed('stripes_data', rows):
+        print('stripes unchanged')
+        return False
+    import stripes
+    banner = stripes.IncrementalStripes(stripes.get_renderer('stripe.png'), 'stripes_state.npz')
+    changed = banner.update(data)
+    print(f'stripes {banner.mode}')
+    if changed or not os.path.exists('stripes.png'):
+        banner.save_png('stripes.png')
+    get_upload_state().record('stripes_data', rows)
+    return changed
+
+
+def ingest_page(tweets_raw, rows, raw, new_ids):
+    # each status's raw JSON is serialized once, straight into the raw
+    # upload; scoring only sees the compact TimelineTweet records. The ids
+    # ingested go to new_ids, not to the seen ids: ingest() records them
+    # once the uploads have gone through
+    seen_ids = get_seen_ids()
+    tweets_raw = [tweet for tweet in tweets_raw if tweet.id not in seen_ids and tweet.id not in new_ids]
+    new_ids.update(tweet.id for tweet in tweets_raw)
+    if not tweets_raw:
+        return []
+    for tweet in tweets_raw:
+        raw.write([tweetjson.dumps(tweet._json)])
+    timestamps = [tweet.created_at.replace(tzinfo=timezone.utc).timestamp() for tweet in tweets_raw]
+    tweets = parse_tweets(tweets_raw)
+    polarities = enrich_polarity_batch([tweet.text for tweet in tweets])
+    get_rolling_polarity().add_batch(polarities, timestamps)
+    for tweet, polarity in zip(tweets, polarities):
+        tweet.polarity = polarity
+        rows.write(tweet.row())
+    return tweets
+
+
+def ingest(since_id):
+    # returns the newest tweet id seen
+    # each page is scored while the next one is being fetched; rows go into
+    # two bulk uploads that post a chunk whenever one fills up, so no more
+    # than a page of Status objects is held at a time
+    rows = bulk_uploader(datasource, ["id", "date", "text", "polarity"])
+    raw = bulk_uploader(datasource_raw, ["tweet"])
+    new_ids = set()
+    try:
+        for tweets_raw in get_tweets(since_id):
+            since_id = max([int(since_id or 0)] + [tweet.id for tweet in tweets_raw])
+            ingest_page(tweets_raw, rows, raw, new_ids)
+            # let the page go while the next one is fetched
+            tweets_raw = None
+    finally:
+        try:
+            rows.close()
+        finally:
+            raw.close()
+    # only now are the tweets uploaded; after a failed upload the next run
+    # fetches the same ones and ingests them again
+    seen_ids = get_seen_ids()
+    for tweet_id in sorted(new_ids):
+        seen_ids.add(tweet_id)
+    if _polarity_cache is not None:
+        print(f'polarity cache {_polarity_cache.stats()}')
+        _polarity_cache.save()
+    get_rolling_polarity().save()
+    print(f'seen ids {seen_ids.stats()}')
+    seen_ids.save()
+    return since_id
+
+
+def read_aggregates():
+    # (polarity, moving average rows), locally when asked to and warmed up
+    rolling_polarity = get_rolling_polarity()
+    if POLARITY_SOURCE == 'local' and not rolling_polarity.is_empty():
+        return rolling_polarity.current(), rolling_polarity.moving_average()
+    # both pipes read what was just ingested but not each other
+    reads = get_tb_client().query_pipes(['alrocar_timeline_polarity', 'alrocar_timeline_moving_average'], config.secret('READ_TOKEN'))
+    return get_polarity(reads['alrocar_timeline_polarity']), get_polarity_mvng_avg(reads['alrocar_timeline_moving_average'])
+
+
+def run():
+    ingest(get_last_tweet_id())
+    polarity, data = read_aggregates()
+    if polarity:
+        hue = get_avatar_atlas().hue(polarity)
+        update_avatar(hue, polarity)
+
+    # no moving average rows: keep the banner rather than draw a blank one
+    if data:
+        create_stripes(data)
+        update_header()
+    print(f'tinybird latency ms {get_tb_client().latency_summary()}')
+
+
+def continuous(interval=CONTINUOUS_INTERVAL):
+    # polls the timeline and only touches the avatar when the polarity moves
+    # to another atlas bucket, and the banner when the stripes change
+    avatar_atlas = get_avatar_atlas()
+    since_id = get_last_tweet_id()
+    bucket = None
+    while True:
+        try:
+            since_id = ingest(since_id)
+            rolling_polarity = get_rolling_polarity()
+            polarity = rolling_polarity.current()
+            if polarity is not None and avatar_atlas.bucket(polarity) != bucket:
+                bucket = avatar_atlas.bucket(polarity)
+                update_avatar(avatar_atlas.hue(polarity), polarity)
+            # nothing to draw until the local aggregate has recent tweets
+            if not rolling_polarity.is_empty() and create_stripes(rolling_polarity.moving_average()):
+                update_header()
+        except Exception as e:
+            print(e)
+        time.sleep(interval)
+
+
+def main(argv=None):
+    global FORCE_UPLOAD
+    parser = argparse.ArgumentParser(description='Update the profile avatar and banner from the timeline polarity')
+    parser.add_argument('--force-upload', action='store_true')
+    parser.add_argument('--continuous', action='store_true')
+    args = parser.parse_args(argv)
+    FORCE_UPLOAD = args.force_upload
+    if args.continuous:
+        continuous()
+    else:
+        run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tinybird  # noqa: E402
+from fake_stream import payloads  # noqa: E402
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+def single_post(rows, datasource_name, columns, token, endpoint, codec=None):
+    # what to_tinybird did before chunking: the whole batch in one buffer, one POST
+    codec = tinybird.get_codec(codec)
+    chunk = tinybird.Buffer(codec)
+    writer = csv.writer(chunk, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+    data = chunk.getvalue()
+    response = tinybird.get_client(endpoint).post(f'{endpoint}/datasources?mode=append&name={datasource_name}',
+                                                  name=datasource_name, files=tinybird.upload_file('csv', data, codec))
+    if response.status_code >= 400:
+        raise Exception(json.dumps(response.json()))
+
+
+def raw_rows(documents):
+    # the avatar.py raw dump: one JSON document per row, produced lazily
+    return ([document] for document in documents)
+
+
+def measure(label, fn, server, count):
+    server.rows.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # the stand-in counts the header of every request as a row
+    print(f'{label:<28} {elapsed:6.2f}s  {count / elapsed:8.0f} rows/s  peak {peak / 2 ** 20:6.1f}MB  '
+          f'{server.requests:>3} requests  {sum(server.rows.values()) - server.requests + server.errors} rows received')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single POST vs chunked bulk upload against a local stand-in')
+    parser.add_argument('--rows', type=int, default=40000)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--codec', default=None)
+    args = parser.parse_args()
+
+    documents = list(payloads(args.rows, seed=0))
+    columns = ['tweet']
+    for label, chunk_bytes, in_flight in (('single post', None, None), ('bulk 1MB x1', 2 ** 20, 1),
+                                          ('bulk 1MB x4', 2 ** 20, 4), ('bulk 4MB x4', 4 * 2 ** 20, 4)):
+        with TinybirdStandIn(latency=args.latency, error_rate=args.error_rate, seed=0) as server:
+            if chunk_bytes is None:
+                if args.error_rate:
+                    continue
+
+                def fn():
+                    single_post(raw_rows(documents), 'bench_raw', columns, 'bench', server.url, args.codec)
+            else:
+                def fn():
+                    uploader = tinybird.BulkUploader('bench_raw', columns, 'bench', endpoint=server.url, codec=args.codec,
+                                                     chunk_bytes=chunk_bytes, max_in_flight=in_flight, backoff=0.05)
+                    uploader.upload(raw_rows(documents))
+                    print(f'  {uploader.stats()}')
+            measure(label, fn, server, args.rows)
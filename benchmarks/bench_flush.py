@@ -0,0 +1,114 @@
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flush  # noqa: E402
+
+
+class FixedController(flush.FlushController):
+    # what the listeners did with a threading.Timer: a fixed window and batch
+    def plan(self):
+        return self.max_window, self.max_records
+
+
+def latency_at(t, phases):
+    # upload latency: `phases` is [(until second, latency), ...]
+    for until, latency in phases:
+        if t < until:
+            return latency
+    return phases[-1][1]
+
+
+def arrivals(rng, seconds, rates):
+    # a Poisson stream whose rate changes every len(rates)-th of the run
+    t = 0.0
+    while True:
+        rate = rates[min(int(t / seconds * len(rates)), len(rates) - 1)]
+        t += rng.expovariate(rate)
+        if t >= seconds:
+            return
+        yield t
+
+
+def simulate(controller_class, args, phases, rates, **kwargs):
+    # drives a controller on a simulated clock; uploads go to `in_flight`
+    # simulated connections and report their latency when they finish
+    rng = random.Random(args.seed)
+    now = [0.0]
+    rows = []
+    free = [0.0] * args.in_flight
+    done = []
+    latencies = []
+    queued = []
+
+    def on_flush():
+        batch, rows[:] = rows[:], []
+        start = max(now[0], min(free))
+        free[free.index(min(free))] = end = start + latency_at(start, phases)
+        queued.append(start - now[0])
+        heapq.heappush(done, (end, end - start))
+        latencies.extend(end - arrived for arrived in batch)
+
+    controller = controller_class(on_flush, target_latency=args.target_latency, max_records=args.max_records,
+                                  max_bytes=1 << 40, in_flight=args.in_flight, clock=lambda: now[0], start=False, **kwargs)
+
+    def advance(t):
+        while True:
+            deadline = controller.deadline()
+            step = min(t, deadline if deadline is not None else t, done[0][0] if done else t)
+            if done and done[0][0] <= step:
+                now[0], seconds = heapq.heappop(done)
+                controller.observe(seconds)
+                continue
+            now[0] = step
+            if step == t:
+                return
+            controller.poll(step)
+
+    for t in arrivals(rng, args.seconds, rates):
+        advance(t)
+        rows.append(t)
+        controller.add(1)
+        controller.poll(t)
+    advance(args.seconds + 3600)
+    controller.poll(force=True)
+    latencies.sort()
+    return {
+        'flushes': controller.flushes,
+        'rows': len(latencies),
+        'mean': statistics.mean(latencies),
+        'p95': latencies[int(0.95 * len(latencies))],
+        'max queued': max(queued),
+        'windows': (min(decision['window'] for decision in controller.decisions),
+                    max(decision['window'] for decision in controller.decisions)),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fixed vs adaptive flushing on a simulated clock')
+    parser.add_argument('--seconds', type=float, default=3600)
+    parser.add_argument('--target-latency', type=float, default=10)
+    parser.add_argument('--max-records', type=int, default=10000)
+    parser.add_argument('--in-flight', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    third = args.seconds / 3
+    scenarios = {
+        'steady, fast uploads': ([(args.seconds, 0.2)], [50]),
+        'slow uploads midway': ([(third, 0.2), (2 * third, 8.0), (args.seconds, 0.2)], [50]),
+        'bursty stream': ([(args.seconds, 0.5)], [5, 2000, 50]),
+    }
+    for name, (phases, rates) in scenarios.items():
+        print(name)
+        for label, cls, kwargs in (('fixed', FixedController, {}), ('adaptive latency', flush.FlushController, {}),
+                                   ('adaptive 500 rows/s', flush.FlushController, {'target_throughput': 500})):
+            result = simulate(cls, args, phases, rates, **kwargs)
+            print(f'  {label:<20} {result["flushes"]:>6} flushes  row latency mean {result["mean"]:6.2f}s '
+                  f'p95 {result["p95"]:6.2f}s  upload queued up to {result["max queued"]:6.2f}s  '
+                  f'window {result["windows"]}')
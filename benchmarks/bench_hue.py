@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import hue_shift  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AVATAR = os.path.join(ROOT, 'avatar.png')
+HUES = [0.0, 0.05, 0.1, 0.1416, 0.2, 0.2833]
+
+
+def current(hue, out_dir):
+    # what update_avatar used to do
+    img = Image.open(AVATAR).convert('RGBA')
+    arr = np.array(img)
+    new_img = Image.fromarray(hue_shift.shift_hue(arr, hue), 'RGBA')
+    new_img.save(os.path.join(out_dir, f'_avatar{str(hue)}.png'))
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for hue in HUES:
+        fn(hue)
+    elapsed = (time.perf_counter() - start) / len(HUES)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<16} {elapsed * 1000:>8.1f} ms/avatar {peak / 2 ** 20:>8.1f} MiB peak')
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as out_dir:
+        measure('float64 + disk', lambda hue: current(hue, out_dir))
+    shifter = hue_shift.HueShifter(AVATAR)
+    measure('lut shift', shifter.shift)
+    measure('float32 shift', lambda hue: shifter.shift(hue, lut=False))
+    measure('lut png', shifter.render_png)
+
+    arr = np.array(Image.open(AVATAR).convert('RGBA'))
+    for hue in HUES:
+        assert (shifter.shift(hue) == hue_shift.shift_hue(arr, hue)).all()
+    print('lut output identical to shift_hue')
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timezone
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_stream import payloads  # noqa: E402
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+class FakeApi():
+    # home_timeline over recorded payloads, newest first; each call parses
+    # its page into fresh Status objects, like tweepy does with a response
+    def __init__(self, documents):
+        self.documents = documents
+        self.ids = [json.loads(document)['id'] for document in documents]
+        self.last_response = SimpleNamespace(headers={'x-rate-limit-remaining': '900',
+                                                      'x-rate-limit-reset': str(int(time.time()) + 900)})
+
+    def home_timeline(self, count=200, since_id=None, max_id=None):
+        import tweepy
+        page = []
+        for i in reversed(range(len(self.documents))):
+            tweet_id = self.ids[i]
+            if (max_id is None or tweet_id <= max_id) and (since_id is None or tweet_id > since_id):
+                page.append(tweepy.models.Status.parse(None, json.loads(self.documents[i])))
+                if len(page) == count:
+                    break
+        return page
+
+
+def ingest_all(avatar, since_id):
+    # the original script: every status of the run, then the rows, then
+    # the raw JSON strings, each uploaded in one request
+    tweets_raw = [tweet for page in avatar.get_tweets(since_id) for tweet in page]
+    tweets = [[tweet.id, tweet.date, tweet.text] for tweet in avatar.parse_tweets(tweets_raw)]
+    polarities = avatar.enrich_polarity_batch([tweet[2] for tweet in tweets])
+    avatar.to_tinybird([tweet + [polarity] for tweet, polarity in zip(tweets, polarities)], avatar.datasource,
+                       ["id", "date", "text", "polarity"])
+    avatar.to_tinybird([[json.dumps(tweet._json)] for tweet in tweets_raw], avatar.datasource_raw, ["tweet"])
+
+
+def ingest_pages(avatar, since_id):
+    # the same per page: two uploads for each page of statuses
+    for tweets_raw in avatar.get_tweets(since_id):
+        tweets = [[tweet.id, tweet.date, tweet.text] for tweet in avatar.parse_tweets(tweets_raw)]
+        polarities = avatar.enrich_polarity_batch([tweet[2] for tweet in tweets])
+        avatar.get_rolling_polarity().add_batch(polarities, [tweet.created_at.replace(tzinfo=timezone.utc).timestamp()
+                                                       for tweet in tweets_raw])
+        avatar.to_tinybird([tweet + [polarity] for tweet, polarity in zip(tweets, polarities)], avatar.datasource,
+                           ["id", "date", "text", "polarity"])
+        avatar.to_tinybird([[json.dumps(tweet._json)] for tweet in tweets_raw], avatar.datasource_raw, ["tweet"])
+
+
+def peak_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+
+def driver(url, mode, count):
+    import avatar
+    import config
+    documents = list(payloads(count, seed=0))
+    api = FakeApi(documents)
+    config.twitter_api = lambda: api
+    avatar.TB_API_URL = url
+    # load the scorer before measuring
+    avatar.enrich_polarity_batch(['warm up'])
+    # reset the peak, so VmHWM only covers the ingest
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    before = peak_rss()
+    start = time.perf_counter()
+    if mode == 'all':
+        ingest_all(avatar, None)
+    elif mode == 'pages':
+        ingest_pages(avatar, None)
+    else:
+        avatar.ingest(None)
+    print(json.dumps({'seconds': time.perf_counter() - start, 'peak': peak_rss() - before}))
+
+
+def run(url, mode, count):
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]),
+               TB_TOKEN='bench', READ_TOKEN='bench')
+    args = [sys.executable, os.path.abspath(__file__), '--driver', url, mode, str(count)]
+    try:
+        out = subprocess.run(args, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    if '--driver' in sys.argv:
+        i = sys.argv.index('--driver')
+        driver(sys.argv[i + 1], sys.argv[i + 2], int(sys.argv[i + 3]))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='Peak memory of one avatar.py timeline ingest')
+    parser.add_argument('--tweets', type=int, default=4000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    for mode, label in (('all', 'whole run in memory'), ('pages', 'per page uploads'), ('stream', 'streaming')):
+        with TinybirdStandIn(latency=args.latency) as server:
+            result = run(server.url, mode, args.tweets)
+            print(f'{label:<22} {args.tweets} tweets in {result["seconds"]:5.2f}s  peak rss +{result["peak"] / 2 ** 20:6.1f}MB  '
+                  f'{server.requests:>3} requests  {sum(server.rows.values()) - server.requests} rows received')
@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tweepy  # noqa: E402
+
+import tweetjson  # noqa: E402
+from fake_stream import payloads  # noqa: E402
+
+
+def bench(label, fn, items, baseline=None):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<36} {1e6 * elapsed / len(items):7.2f}us/payload'
+          + (f'  x{baseline / elapsed:.1f}' if baseline else ''))
+    return elapsed
+
+
+def read_payloads(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decode and encode recorded stream payloads')
+    parser.add_argument('--payloads', help='NDJSON file of raw payloads; generated when missing')
+    parser.add_argument('--tweets', type=int, default=20000)
+    args = parser.parse_args()
+    raw = read_payloads(args.payloads) if args.payloads else list(payloads(args.tweets))
+    print(f'{len(raw)} payloads, {sum(map(len, raw)) / len(raw):.0f} bytes on average, backends {sorted(tweetjson.BACKENDS)}')
+
+    api = tweepy.API()
+    print('decode')
+    baseline = bench('json.loads + tweepy Status.parse', lambda r: tweepy.models.Status.parse(api, json.loads(r)), raw)
+    bench('json.loads (on_data before)', json.loads, raw, baseline)
+    for name in sorted(tweetjson.BACKENDS):
+        backend = tweetjson.get_backend(name)
+        bench(f'{name} loads', backend.loads, raw, baseline)
+    bench('tweetjson.decode', tweetjson.decode, raw, baseline)
+    bench('tweetjson.decode_head', tweetjson.decode_head, raw, baseline)
+
+    print('encode (ndjson sink rows)')
+    rows = []
+    for tweet in map(json.loads, raw):
+        rows.append({'search_term': 'Merry Christmas', 'tweet': tweet['text'], 'date': tweetjson.format_date(tweet['created_at'])})
+    baseline = bench('json.dumps + newline (before)', lambda row: (json.dumps(row) + '\n').encode('utf-8'), rows)
+    for name in sorted(tweetjson.BACKENDS):
+        bench(f'{name} dumps_line', tweetjson.get_backend(name).dumps_line, rows, baseline)
@@ -0,0 +1,37 @@
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer  # noqa: E402
+
+
+RAW = [
+    'RT @someone: Merry Christmas to all!!! #xmas https://t.co/AbC123xyz',
+    "covid-19 cases are up 20% today, stay safe & don't go out",
+    'Feliz Navidad a todos 🎄🎅 ¡qué año! https://t.co/q1w2e3',
+    'new vaccine data: 95% efficacy\n\nread more at http://example.com/a?b=c',
+    'just a plain tweet without anything special in it',
+]
+
+
+def reference(text):
+    return " ".join(re.sub("([^0-9A-Za-z \t])|(\w+:\/\/\S+)", "", text).split())
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    texts = [rng.choice(RAW) for _ in range(10000)]
+    assert normalizer.normalize_batch(texts) == [reference(text) for text in texts]
+
+    number = 20
+    for label, fn in (
+        ('re.sub', lambda: [reference(text) for text in texts]),
+        ('normalize', lambda: [normalizer.normalize(text) for text in texts]),
+        ('batch', lambda: normalizer.normalize_batch(texts)),
+    ):
+        elapsed = timeit.timeit(fn, number=number)
+        print(f'{label:<10} {len(texts) * number / elapsed:>12.0f} texts/sec')
@@ -0,0 +1,123 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the sinks read the Tinybird token when they are created
+os.environ.setdefault('TB_TOKEN', 'bench')
+
+import tweepy  # noqa: E402
+
+import metrics  # noqa: E402
+import replay  # noqa: E402
+import terms  # noqa: E402
+from fake_stream import write_payloads  # noqa: E402
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Stages():
+    # wall time and calls per wrapped callable
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+        return timed
+
+
+def run(script, path, mode, rate, speed, flush_rows, workers, latency, track=('bench',), route='tag'):
+    module = importlib.import_module(script)
+    stages = Stages()
+    listener_on_data = tweepy.StreamListener.on_data
+    tweepy.StreamListener.on_data = stages.wrap('tweepy', listener_on_data)
+    if script == 'polarity':
+        parse_payload = module.pipeline.parse_payload
+        enrich_polarity = module.enrich_polarity
+        module.pipeline.parse_payload = stages.wrap('parse', parse_payload)
+        module.enrich_polarity = stages.wrap('score', enrich_polarity)
+    try:
+        with TinybirdStandIn(latency=latency) as server:
+            module.TB_API_URL = server.url
+            before = rss()
+            with contextlib.redirect_stdout(io.StringIO()):
+                kwargs = {'workers': workers} if script == 'polarity' else {}
+                listener = module.MyStreamListener('tweets', None, list(track), max_wait_records=flush_rows,
+                                                   route=route, **kwargs)
+                listener.on_data = stages.wrap('on_data', listener.on_data)
+                listener.append = stages.wrap('append', listener.append)
+                listener.sink.flush = stages.wrap('flush', listener.sink.flush)
+                listener.sink.upload = stages.wrap('upload', listener.sink.upload)
+                source = replay.ReplaySource(path, mode, rate=rate, speed=speed)
+                count, elapsed = replay.replay(listener, source)
+                after = rss()
+                start = time.perf_counter()
+                listener.close()
+                drain = time.perf_counter() - start
+            received = sum(server.rows.values())
+    finally:
+        tweepy.StreamListener.on_data = listener_on_data
+        if script == 'polarity':
+            module.pipeline.parse_payload = parse_payload
+            module.enrich_polarity = enrich_polarity
+
+    seconds = stages.seconds
+    inner = sum(seconds.get(name, 0.0) for name in ('tweepy', 'parse', 'score', 'append'))
+    seconds['other'] = seconds.get('on_data', 0.0) - inner
+    print(f'{script} ({mode}{", %d workers" % workers if workers else ""}): {count} tweets in {elapsed:.2f}s, '
+          f'{count / elapsed:.0f} tweets/s, max lag {source.lag:.3f}s, close {drain:.2f}s, '
+          f'{received} rows received, rss +{(after - before) / 1e6:.1f}MB')
+    for name in ('on_data', 'tweepy', 'parse', 'score', 'other', 'append', 'flush', 'upload'):
+        if name in stages.calls or name == 'other':
+            calls = stages.calls.get(name, stages.calls.get('on_data', 0))
+            print(f'  {name:<8} {seconds.get(name, 0.0):7.3f}s  {calls:>7} calls  '
+                  f'{1e6 * seconds.get(name, 0.0) / max(calls, 1):8.1f}us/call')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded stream payloads through the listeners')
+    parser.add_argument('--payloads', help='NDJSON file of raw payloads; generated when missing')
+    parser.add_argument('--tweets', type=int, default=20000)
+    parser.add_argument('--script', choices=('polarity', 'streaming'), action='append')
+    parser.add_argument('--mode', choices=('fast', 'rate', 'original'), default='fast')
+    parser.add_argument('--rate', type=float)
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--flush-rows', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--track', default='bench', help='comma separated terms to tag tweets with')
+    parser.add_argument('--route', choices=('tag', 'sink'), default='tag')
+    parser.add_argument('--metrics', action='store_true', help='enable stage metrics and print a snapshot')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    path = args.payloads
+    if not path:
+        path = write_payloads(os.path.join(tempfile.gettempdir(), f'bench_payloads_{args.tweets}.ndjson'), args.tweets)
+    for script in args.script or ['polarity', 'streaming']:
+        run(script, path, args.mode, args.rate, args.speed, args.flush_rows, args.workers, args.latency,
+            track=terms.parse_terms(args.track), route=args.route)
+    if args.metrics:
+        print(json.dumps(metrics.registry.snapshot(), indent=2))
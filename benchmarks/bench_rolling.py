@@ -0,0 +1,39 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rolling  # noqa: E402
+import tinybird  # noqa: E402
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+PIPES = ['alrocar_timeline_polarity', 'alrocar_timeline_moving_average']
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    now = time.time()
+    aggregate = rolling.RollingPolarity()
+    events = [(rng.uniform(-1, 1), now - rng.uniform(0, 200 * 3600)) for _ in range(200000)]
+    start = time.perf_counter()
+    for polarity, timestamp in events:
+        aggregate.add(polarity, timestamp)
+    elapsed = time.perf_counter() - start
+    print(f'add                {1e6 * elapsed / len(events):8.2f}us/tweet')
+
+    start = time.perf_counter()
+    for _ in range(100):
+        polarity, rows = aggregate.current(), aggregate.moving_average()
+    print(f'local read         {1e3 * (time.perf_counter() - start) / 100:8.2f}ms  ({len(rows)} stripes)')
+
+    pipes = {PIPES[0]: [{'polarity': polarity}], PIPES[1]: rows}
+    for latency in (0.05, 0.2):
+        with TinybirdStandIn(latency=latency, pipes=pipes) as server:
+            client = tinybird.TinybirdClient(server.url)
+            start = time.perf_counter()
+            for _ in range(10):
+                client.query_pipes(PIPES, 'token')
+            print(f'pipes @{int(latency * 1000):>3}ms      {1e3 * (time.perf_counter() - start) / 10:8.2f}ms')
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textblob import TextBlob  # noqa: E402
+
+import scoring  # noqa: E402
+from corpus import tweet_texts  # noqa: E402
+
+
+def textblob_path(texts):
+    return [round(TextBlob(text).sentiment.polarity, 4) for text in texts]
+
+
+def run(label, fn, texts):
+    start = time.perf_counter()
+    result = fn(texts)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {len(texts) / elapsed:>12.0f} tweets/sec')
+    return result
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    duplicates = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    texts = tweet_texts(count, duplicates=duplicates)
+    # load the lexicon outside of the timed sections
+    scorer = scoring.get_scorer()
+    TextBlob('warm up').sentiment
+
+    expected = run('textblob', textblob_path, texts)
+    got = run('batched', scorer.score_batch, texts)
+    mismatches = sum(1 for e, g in zip(expected, got) if e != g)
+    print(f'mismatches   {mismatches}')
+
+    cache = scoring.PolarityCache(scorer=scorer)
+    run('cached', lambda texts: [cache.score(text) for text in texts], texts)
+    print(f'cache        {cache.stats()}')
@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+import scoring  # noqa: E402
+import seen  # noqa: E402
+import tweetjson  # noqa: E402
+from fake_stream import START, payloads  # noqa: E402
+
+
+def stream_ids(count, rng, per_second=50):
+    # snowflake ids from START on, a few of them a little out of order
+    timestamp = START.timestamp()
+    ids = []
+    for i in range(count):
+        timestamp += rng.expovariate(per_second)
+        ids.append(seen.time_id(timestamp - (rng.uniform(0, 5) if rng.random() < 0.01 else 0)) + i % 4096)
+    return ids
+
+
+def reconnects(documents, every, overlap):
+    # a stream that reconnects every `every` payloads and gets the last
+    # `overlap` of them again
+    out = []
+    for start in range(0, len(documents), every):
+        out.extend(documents[max(start - overlap, 0):start + every])
+    return out
+
+
+def measure(label, make, ids):
+    ids_seen = make()
+    start = time.perf_counter()
+    for tweet_id in ids:
+        ids_seen.add(tweet_id)
+    elapsed = time.perf_counter() - start
+    # memory is measured on a second pass, tracemalloc slows the first down
+    tracemalloc.start()
+    ids_seen = make()
+    for tweet_id in ids:
+        ids_seen.add(tweet_id)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{label:<20} {1e9 * elapsed / len(ids):7.0f}ns/id  {size / len(ids_seen):6.1f} bytes/id')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seen-id dedupe: memory, cost per id and the work it saves')
+    parser.add_argument('--ids', type=int, default=1000000)
+    parser.add_argument('--payloads', type=int, default=20000)
+    parser.add_argument('--every', type=int, default=1000)
+    parser.add_argument('--overlap', type=int, default=200)
+    args = parser.parse_args()
+
+    ids = stream_ids(args.ids, random.Random(0))
+    clock = lambda: START.timestamp() + args.ids / 50  # noqa: E731
+    measure('set', set, ids)
+    measure('SeenIds', lambda: seen.SeenIds(max_age=10 * 86400, max_ids=args.ids, clock=clock), ids)
+
+    documents = list(payloads(args.payloads, seed=0))
+    stream = reconnects(documents, args.every, args.overlap)
+
+    def ingest(raw_data, ids_seen, cache):
+        if ids_seen is not None and ids_seen.duplicate(tweetjson.tweet_id(raw_data)):
+            return 0
+        tweet = pipeline.parse_payload(raw_data, 'covid')
+        cache.score(tweet[2])
+        return 1
+
+    # expiry is relative to the newest payload, not today
+    now = seen.id_time(tweetjson.tweet_id(documents[-1]))
+    for raw_data in documents[:100]:
+        ingest(raw_data, None, scoring.PolarityCache())
+    for label, ids_seen in (('no dedupe', None), ('dedupe', seen.SeenIds(clock=lambda: now))):
+        cache = scoring.PolarityCache()
+        start = time.perf_counter()
+        rows = sum(ingest(raw_data, ids_seen, cache) for raw_data in stream)
+        elapsed = time.perf_counter() - start
+        print(f'{label:<20} {len(stream)} payloads in {elapsed:.2f}s, {rows} rows to upload'
+              + (f'  {ids_seen.stats()}' if ids_seen else ''))
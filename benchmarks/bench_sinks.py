@@ -0,0 +1,99 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tinybird  # noqa: E402
+from corpus import tweet_texts  # noqa: E402
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+# (label, sink class, codec, max_in_flight, spool, latency, error rate)
+CONFIGS = [
+    ('csv', tinybird.TinybirdApiSink, None, 2, False, 0.02, 0.0),
+    ('csv gzip', tinybird.TinybirdApiSink, 'gzip', 2, False, 0.02, 0.0),
+    ('csv gzip 1 slot', tinybird.TinybirdApiSink, 'gzip', 1, False, 0.02, 0.0),
+    ('csv gzip 4 slots', tinybird.TinybirdApiSink, 'gzip', 4, False, 0.02, 0.0),
+    ('ndjson', tinybird.TinybirdNdjsonSink, None, 2, False, 0.02, 0.0),
+    ('ndjson gzip', tinybird.TinybirdNdjsonSink, 'gzip', 2, False, 0.02, 0.0),
+    ('csv gzip 10% err', tinybird.TinybirdApiSink, 'gzip', 2, False, 0.02, 0.1),
+    ('csv gzip spool 10% err', tinybird.TinybirdApiSink, 'gzip', 2, True, 0.02, 0.1),
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def records(count, search_term='covid'):
+    date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    for i, text in enumerate(tweet_texts(count, seed=1)):
+        yield [str(1470000000000000000 + i), date, text, search_term, 0.0]
+
+
+def ndjson(rows):
+    for id, date, text, search_term, polarity in rows:
+        yield {'search_term': search_term, 'tweet': text, 'date': date}
+
+
+def run(label, sink_class, codec, max_in_flight, spool, latency, error_rate, count, flush_rows):
+    spool_dir = tempfile.mkdtemp(prefix='bench_spool_') if spool else None
+    rows = records(count)
+    if sink_class is tinybird.TinybirdNdjsonSink:
+        rows = ndjson(rows)
+    with TinybirdStandIn(latency=latency, error_rate=error_rate, seed=1) as server:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sink = sink_class('token', 'bench', endpoint=server.url, max_in_flight=max_in_flight,
+                              codec=codec, spool=spool_dir)
+            start = time.perf_counter()
+            # the listeners flush every max_wait_records rows
+            for n, row in enumerate(rows, 1):
+                sink.append(row)
+                if n % flush_rows == 0:
+                    sink.flush()
+            sink.close()
+            elapsed = time.perf_counter() - start
+            # failed segments go back to the spool; catch up before counting
+            if spool:
+                server.error_rate = 0.0
+                sink.replay()
+        received = server.rows.get('bench', 0)
+    if spool_dir:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    latencies = [1000 * s for s in sink.flush_latencies]
+    print(f'{label:<24} {count / elapsed:>9.0f} rows/s  '
+          f'flush p50 {percentile(latencies, 50):6.1f}ms p95 {percentile(latencies, 95):6.1f}ms '
+          f'p99 {percentile(latencies, 99):6.1f}ms  {sink.flushes} flushes ({sink.failed_flushes} failed)  '
+          f'{sink.wire_bytes} wire bytes  dropped {count - received} rows')
+
+
+def run_pipes(latency, reads=20):
+    pipes = {'polarity': [{'polarity': 12.5}], 'moving_average': [{'polarity': 1.0}] * 100}
+    with TinybirdStandIn(latency=latency, pipes=pipes) as server:
+        client = tinybird.TinybirdClient(server.url)
+        for label, concurrency in (('pipes sequential', 1), ('pipes concurrent', None)):
+            start = time.perf_counter()
+            for _ in range(reads):
+                client.query_pipes(list(pipes), 'token', concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print(f'{label:<24} {1000 * elapsed / reads:6.1f}ms per avatar.py read')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end sink throughput against a local Tinybird stand-in')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--flush-rows', type=int, default=2000)
+    args = parser.parse_args()
+    for config in CONFIGS:
+        run(*config, count=args.rows, flush_rows=args.flush_rows)
+    run_pipes(latency=0.05)
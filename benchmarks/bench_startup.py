@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tinybird_server import TinybirdStandIn  # noqa: E402
+
+
+HEAVY = ('numpy', 'PIL', 'textblob', 'nltk', 'tweepy')
+# what avatar.py imported up front before the modules loaded them lazily
+EAGER = ('numpy', 'PIL.Image', 'tweepy')
+
+
+class FakeTwitter():
+    # home_timeline with no new tweets; uploads are counted, not sent
+    last_response = None
+
+    def __init__(self):
+        self.uploads = 0
+
+    def home_timeline(self, **kwargs):
+        return []
+
+    def update_profile_image(self, *args, **kwargs):
+        self.uploads += 1
+
+    def update_profile_banner(self, *args, **kwargs):
+        self.uploads += 1
+
+
+def driver(url, eager):
+    # one hourly run of avatar.py in this process, against the stand-in
+    if eager:
+        for name in EAGER:
+            __import__(name)
+    import avatar
+    import config
+    avatar.TB_API_URL = url
+    twitter = FakeTwitter()
+
+    def twitter_api():
+        # a real run loads tweepy to ask for the timeline
+        __import__('tweepy')
+        return twitter
+
+    config.twitter_api = twitter_api
+    avatar.main([])
+    print(json.dumps({'heavy': [name for name in HEAVY if name in sys.modules], 'uploads': twitter.uploads}))
+
+
+def run(workdir, url, eager=False):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]),
+               CONSUMER_KEY='bench', CONSUMER_SECRET='bench', ACCESS_TOKEN='bench', ACCESS_TOKEN_SECRET='bench',
+               TB_TOKEN='bench', READ_TOKEN='bench')
+    args = [sys.executable, os.path.abspath(__file__), '--driver', url] + (['--eager'] if eager else [])
+    start = time.perf_counter()
+    out = subprocess.run(args, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - start, json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    if '--driver' in sys.argv:
+        driver(sys.argv[sys.argv.index('--driver') + 1], '--eager' in sys.argv)
+        sys.exit()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    for name in ('avatar.png', 'stripe.png'):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    pipes = {
+        'alrocar_timeline_max_id': [{'since_id': 1474000000000000000}],
+        'alrocar_timeline_polarity': [{'polarity': 12.5}],
+        'alrocar_timeline_moving_average': [{'polarity': p / 10} for p in range(-500, 1000, 10)],
+    }
+    with TinybirdStandIn(pipes=pipes) as server:
+        subprocess.run([sys.executable, os.path.join(ROOT, 'atlas.py')], cwd=workdir, check=True, capture_output=True)
+        seconds, first = run(workdir, server.url)
+        print(f'first run (renders and uploads)  {seconds:.2f}s  loaded {first["heavy"]}, {first["uploads"]} uploads')
+        for label, eager in (('no new tweets, eager imports', True), ('no new tweets, lazy imports', False)):
+            runs = [run(workdir, server.url, eager) for _ in range(5)]
+            print(f'{label:<33} {statistics.median(s for s, _ in runs):.2f}s  loaded {runs[0][1]["heavy"]}, '
+                  f'{runs[0][1]["uploads"]} uploads')
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,59 @@
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import stripes  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STRIPE = os.path.join(ROOT, 'stripe.png')
+
+
+def current(data):
+    # create_stripes before the vectorized renderer, minus the final save
+    banner = Image.new(mode="RGB", size=(1500, 500))
+    i = 0
+    for p in data:
+        img = Image.open(STRIPE).convert('RGBA')
+        aa = img.load()
+        hues = stripes.HUES
+        data = np.array(img)
+        r1 = aa[0, 0][0]
+        g1 = aa[0, 0][1]
+        b1 = aa[0, 0][2]
+        hue = hues[math.floor((p['polarity'] + 100) / (200 / len(hues))) % len(hues)]
+        red, green, blue = data[:,:,0], data[:,:,1], data[:,:,2]
+        mask = (red == r1) & (green == g1) & (blue == b1)
+        data[:,:,:3][mask] = hue
+        new_img = Image.fromarray(data)
+        Image.Image.paste(banner, new_img, (10 * i, 0))
+        i += 1
+    return np.array(banner)
+
+
+def timed(label, fn, data, number=20):
+    start = time.perf_counter()
+    for _ in range(number):
+        result = fn(data)
+    print(f'{label:<12} {(time.perf_counter() - start) / number * 1000:>8.2f} ms/banner')
+    return result
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 160
+    rng = random.Random(0)
+    data = [{'polarity': rng.uniform(-100, 100)} for _ in range(count)] + [{'polarity': -100}, {'polarity': 100}]
+    renderer = stripes.StripesRenderer(STRIPE)
+    expected = timed('per stripe', current, data)
+    got = timed('vectorized', renderer.render, data).copy()
+    assert (expected == got).all()
+    for n in (0, 1, 37, 150):
+        assert (current(data[:n]) == renderer.render(data[:n])).all()
+    print('pixel identical')
@@ -0,0 +1,69 @@
+import random
+import re
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import terms  # noqa: E402
+from corpus import FILLER, tweet_texts  # noqa: E402
+
+
+def tracked(count, seed=0):
+    # the real track list first, then made up one and two word phrases
+    rng = random.Random(seed)
+    track = ['Merry Christmas', 'christmas', 'Navidad', 'Happy New Year', 'covid', 'covid-19', 'omicron', 'vaccine']
+    while len(track) < count:
+        word = f'topic{len(track)}'
+        track.append(word if rng.random() < 0.5 else f'{word} {rng.choice(FILLER)}')
+    return track[:count]
+
+
+def texts(count, track, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for text in tweet_texts(count, seed=seed):
+        if rng.random() < 0.5:
+            text += ' #' + rng.choice(track)
+        out.append(text)
+    return out
+
+
+class NaiveTagger():
+    # what a loop over the terms costs: every term checked against every tweet
+    def __init__(self, track):
+        self.track = [(term, set(terms.words(term))) for term in track]
+
+    def match(self, text):
+        text_words = set(terms.words(text))
+        return [term for term, term_words in self.track if term_words <= text_words]
+
+
+class RegexTagger():
+    # one alternation of single word terms, phrases left out
+    def __init__(self, track):
+        self.pattern = re.compile(r'\b(?:' + '|'.join(re.escape(t.lower()) for t in track if ' ' not in t) + r')\b')
+
+    def match(self, text):
+        return self.pattern.findall(text.lower())
+
+
+def bench(label, tagger, items):
+    start = time.perf_counter()
+    for text in items:
+        tagger.match(text)
+    elapsed = time.perf_counter() - start
+    return len(items) / elapsed
+
+
+if __name__ == '__main__':
+    print(f'{"terms":>6} {"TermTagger":>12} {"naive loop":>12} {"regex":>12}  tweets/s')
+    for count in (1, 4, 10, 100, 500, 2000):
+        track = tracked(count)
+        items = texts(20000, track)
+        tagger = terms.TermTagger(track)
+        naive = NaiveTagger(track)
+        assert all(tagger.match(t) == naive.match(t) for t in items[:2000])
+        print(f'{count:>6} {bench("tagger", tagger, items):>12.0f} {bench("naive", naive, items):>12.0f} '
+              f'{bench("regex", RegexTagger(track), items):>12.0f}')
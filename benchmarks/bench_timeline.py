@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timeline  # noqa: E402
+from fake_timeline import FakeClock, FakeTimeline  # noqa: E402
+
+
+def process(page, seconds):
+    # stands in for normalize + score + upload of one page
+    time.sleep(seconds)
+
+
+def run(label, prefetch, latency, work):
+    clock = FakeClock()
+    source = FakeTimeline(size=4000, clock=clock, latency=latency)
+    fetcher = timeline.TimelineFetcher(source, pages=20, prefetch=prefetch, clock=clock.time, sleep=clock.sleep)
+    start = time.perf_counter()
+    tweets = 0
+    for page in fetcher.pages():
+        process(page, work)
+        tweets += len(page)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {tweets} tweets, {fetcher.requests} requests, {elapsed:.2f}s wall, '
+          f'{fetcher.waited:.0f}s rate-limit wait ({fetcher.waits} waits), fixed sleep would be {20 * 65}s')
+    return tweets
+
+
+if __name__ == '__main__':
+    assert run('sequential', 0, latency=0.05, work=0.05) == 4000
+    assert run('pipelined', 1, latency=0.05, work=0.05) == 4000
@@ -0,0 +1,25 @@
+import random
+
+
+FILLER = [
+    'the', 'a', 'is', 'to', 'and', 'of', 'in', 'it', 'for', 'on', 'with', 'this', 'that', 'you', 'we',
+    'covid', 'vaccine', 'omicron', 'christmas', 'today', 'people', 'cases', 'new', 'RT', '19', '2021',
+    'not', 'no', 'never', 'really', 'very', 'so', 'just', 'httpstco', 'amp',
+]
+SENTIMENT = [
+    'good', 'bad', 'great', 'terrible', 'happy', 'sad', 'best', 'worst', 'merry', 'sick', 'safe',
+    'awful', 'nice', 'wonderful', 'horrible', 'positive', 'negative', 'amazing', 'scary', 'free',
+]
+
+
+def tweet_texts(count, seed=0, duplicates=0.0):
+    # normalized tweet texts, i.e. what enrich_polarity receives
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        if texts and rng.random() < duplicates:
+            texts.append(rng.choice(texts))
+            continue
+        words = [rng.choice(SENTIMENT) if rng.random() < 0.15 else rng.choice(FILLER) for _ in range(rng.randint(5, 30))]
+        texts.append(' '.join(words))
+    return texts
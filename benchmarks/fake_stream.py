@@ -0,0 +1,79 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from corpus import tweet_texts
+
+
+START = datetime(2021, 12, 24, 18, 0, tzinfo=timezone.utc)
+
+
+def user(rng, i):
+    return {
+        'id': 100000 + i % 5000,
+        'id_str': str(100000 + i % 5000),
+        'name': f'user {i % 5000}',
+        'screen_name': f'user{i % 5000}',
+        'location': rng.choice(['', 'Madrid', 'London', 'New York']),
+        'description': ' '.join(rng.choice(['love', 'coffee', 'dad', 'engineer', 'views are my own']) for _ in range(8)),
+        'followers_count': rng.randint(0, 100000),
+        'friends_count': rng.randint(0, 5000),
+        'statuses_count': rng.randint(0, 100000),
+        'created_at': 'Mon Jan 05 10:00:00 +0000 2015',
+        'verified': False,
+        'profile_image_url_https': f'https://pbs.twimg.com/profile_images/{i}/photo_normal.jpg',
+    }
+
+
+def status(rng, i, text, created):
+    truncated = len(text) > 100
+    tweet = {
+        'created_at': created.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+        'id': 1474000000000000000 + i,
+        'id_str': str(1474000000000000000 + i),
+        'text': text[:100] + ('...' if truncated else ''),
+        'source': '<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>',
+        'truncated': truncated,
+        'in_reply_to_status_id': None,
+        'user': user(rng, i),
+        'geo': None,
+        'coordinates': None,
+        'place': None,
+        'is_quote_status': False,
+        'retweet_count': 0,
+        'favorite_count': 0,
+        'entities': {'hashtags': [{'text': 'christmas', 'indices': [0, 10]}], 'urls': [], 'user_mentions': [], 'symbols': []},
+        'favorited': False,
+        'retweeted': False,
+        'filter_level': 'low',
+        'lang': 'en',
+        'timestamp_ms': str(int(created.timestamp() * 1000)),
+    }
+    if truncated:
+        tweet['extended_tweet'] = {'full_text': text, 'display_text_range': [0, len(text)], 'entities': tweet['entities']}
+    return tweet
+
+
+def payloads(count, seed=0, per_second=50):
+    # raw stream payloads (what on_data receives); ~1 in 3 is a retweet and
+    # ~1 in 10 quotes another tweet, like the real filter stream
+    rng = random.Random(seed)
+    texts = tweet_texts(count * 2, seed=seed)
+    created = START
+    for i in range(count):
+        created += timedelta(seconds=rng.expovariate(per_second))
+        tweet = status(rng, i, texts[2 * i], created)
+        if rng.random() < 0.3:
+            tweet['retweeted_status'] = status(rng, count + i, texts[2 * i + 1], created - timedelta(hours=1))
+        elif rng.random() < 0.1:
+            tweet['is_quote_status'] = True
+            tweet['quoted_status'] = status(rng, count + i, texts[2 * i + 1], created - timedelta(hours=2))
+        # the stream sends compact JSON
+        yield json.dumps(tweet, separators=(',', ':'))
+
+
+def write_payloads(path, count, seed=0, per_second=50):
+    with open(path, 'w', encoding='utf-8') as f:
+        for raw_data in payloads(count, seed, per_second):
+            f.write(raw_data + '\n')
+    return path
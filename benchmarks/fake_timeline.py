@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+
+
+class FakeClock():
+    def __init__(self, start=1_600_000_000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeTimeline():
+    # Stands in for api.home_timeline: serves `size` statuses newest first,
+    # honours since_id/max_id/count and enforces `limit` requests per
+    # `window` seconds, answering with Twitter's rate-limit headers.
+    def __init__(self, size=4000, limit=15, window=900, clock=None, latency=0.0):
+        self.statuses = [
+            SimpleNamespace(id=10_000 + i, created_at='2021-12-24 10:00:00', text=f'merry christmas number {i} https://t.co/x',
+                            _json={'id': 10_000 + i})
+            for i in reversed(range(size))
+        ]
+        self.limit = limit
+        self.window = window
+        self.clock = clock or FakeClock()
+        self.latency = latency
+        self.window_start = self.clock.time()
+        self.used = 0
+        self.calls = 0
+
+    def headers(self):
+        return {
+            'x-rate-limit-remaining': str(self.limit - self.used),
+            'x-rate-limit-reset': str(int(self.window_start + self.window)),
+        }
+
+    def __call__(self, count=200, since_id=None, max_id=None):
+        from timeline import RateLimited
+
+        if self.clock.time() >= self.window_start + self.window:
+            self.window_start = self.clock.time()
+            self.used = 0
+        if self.used >= self.limit:
+            raise RateLimited(self.headers())
+        self.used += 1
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        page = [s for s in self.statuses if (since_id is None or s.id > since_id) and (max_id is None or s.id <= max_id)]
+        return page[:count], self.headers()
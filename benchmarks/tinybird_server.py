@@ -0,0 +1,153 @@
+import csv
+import gzip
+import io
+import json
+import random
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+
+
+class TinybirdStandIn():
+    # Local stand-in for the bits of the Tinybird API these scripts use:
+    #   POST /v0/datasources?mode=append&name=...[&format=ndjson]
+    #        multipart csv/ndjson file, optionally gzip compressed (.gz)
+    #   GET  /v0/pipes/<name>.json -> {"data": pipes.get(name, [])}
+    # Every request waits `latency` (+ up to `jitter`) seconds and fails with
+    # `error_status` with probability `error_rate`. Appended rows are
+    # counted per datasource in `rows`.
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=500, pipes=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.pipes = pipes or {}
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.rows = {}
+        self.bytes = {}
+        self.requests = 0
+        self.errors = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v0'
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, name='tinybird_stand_in', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+    def delay(self):
+        seconds = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if seconds:
+            time.sleep(seconds)
+
+    def append(self, name, format, files):
+        rows = 0
+        size = 0
+        for filename, data in files:
+            size += len(data)
+            if filename and filename.endswith('.gz'):
+                data = gzip.decompress(data)
+            text = data.decode('utf-8')
+            if format == 'ndjson':
+                for line in text.splitlines():
+                    if line:
+                        json.loads(line)
+                        rows += 1
+            else:
+                rows += sum(1 for _ in csv.reader(io.StringIO(text)))
+        with self.lock:
+            self.rows[name] = self.rows.get(name, 0) + rows
+            self.bytes[name] = self.bytes.get(name, 0) + size
+        return rows
+
+    def handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                stand_in.delay()
+                if stand_in.should_fail():
+                    return self.reply(stand_in.error_status, {'error': 'injected'})
+                if url.path.startswith('/v0/pipes/') and url.path.endswith('.json'):
+                    name = url.path[len('/v0/pipes/'):-len('.json')]
+                    return self.reply(200, {'data': stand_in.pipes.get(name, [])})
+                self.reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stand_in.delay()
+                if stand_in.should_fail():
+                    return self.reply(stand_in.error_status, {'error': 'injected'})
+                if url.path != '/v0/datasources':
+                    return self.reply(404, {'error': 'not found'})
+                params = parse_qs(url.query)
+                name = params.get('name', [''])[0]
+                format = params.get('format', ['csv'])[0]
+                message = BytesParser(policy=policy.default).parsebytes(
+                    f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode('utf-8') + body)
+                files = [(part.get_filename(), part.get_payload(decode=True)) for part in message.iter_parts()]
+                try:
+                    rows = stand_in.append(name, format, files)
+                except Exception as e:
+                    return self.reply(400, {'error': str(e)})
+                self.reply(200, {'datasource': {'name': name}, 'rows': rows})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a local Tinybird stand-in')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    stand_in = TinybirdStandIn(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f'listening on {stand_in.url}')
+    stand_in.server.serve_forever()
@@ -0,0 +1,25 @@
+import argparse
+import importlib
+import sys
+
+
+# command -> module with a main(argv); the module is only imported once the
+# command is known, so `cli.py avatar` never loads the streaming code
+COMMANDS = {
+    'avatar': 'avatar',
+    'atlas': 'atlas',
+    'stream': 'streaming',
+    'polarity': 'polarity',
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='sentiment avatar jobs')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the command, see <command> --help')
+    args = parser.parse_args(argv)
+    return importlib.import_module(COMMANDS[args.command]).main(args.args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
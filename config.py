@@ -0,0 +1,22 @@
+import os
+
+
+# Secrets and clients are looked up when first used, not at import, so the
+# modules can be imported without credentials and a run that never talks to
+# Twitter never loads tweepy.
+
+_twitter_api = None
+
+
+def secret(name):
+    return os.environ[name]
+
+
+def twitter_api():
+    global _twitter_api
+    if _twitter_api is None:
+        import tweepy
+        auth = tweepy.OAuthHandler(secret('CONSUMER_KEY'), secret('CONSUMER_SECRET'))
+        auth.set_access_token(secret('ACCESS_TOKEN'), secret('ACCESS_TOKEN_SECRET'))
+        _twitter_api = tweepy.API(auth, timeout=300)
+    return _twitter_api
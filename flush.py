@@ -0,0 +1,185 @@
+import time
+from collections import deque
+from threading import Condition, Thread
+
+import metrics
+
+
+class FlushController():
+    # Decides when a listener flushes its sinks. One scheduler thread per
+    # listener makes every flush, so time-based and size-based flushes can
+    # no longer race, and no thread is started per flush window. The ingest
+    # side only reports what it buffered with add(), and wakes the
+    # scheduler when a limit is hit.
+    #
+    # The flush window and the batch size are tuned from the incoming rate
+    # and the upload latency reported through observe():
+    #   target_latency     window = target_latency - upload latency, so a
+    #                      row is uploaded about target_latency seconds after
+    #                      it arrived, and batch = rate * window.
+    #   target_throughput  batches are sized so that `in_flight` concurrent
+    #                      uploads carry target_throughput rows/s, and the
+    #                      window is however long the stream takes to fill
+    #                      one.
+    # A full batch flushes before its window is over, but flushes are never
+    # closer together than latency / in_flight * headroom, so uploads don't
+    # queue up behind a slow endpoint; a burst makes the batches bigger
+    # instead. max_records and max_bytes always flush straight away.
+    # Every flush is recorded in `decisions`.
+    #
+    # poll(now) makes one decision and flushes if it is due. The thread
+    # just calls it at each deadline, so the controller can be driven
+    # without a thread (start=False) and with a simulated clock.
+    def __init__(self, flush, name='flush', target_latency=10, target_throughput=None, max_records=10000,
+                 max_bytes=1024*1024*1, min_records=1, min_window=0.1, max_window=None, in_flight=2,
+                 headroom=1.5, smoothing=0.3, clock=time.monotonic, start=True):
+        self.flush = flush
+        self.name = name
+        self.target_latency = target_latency
+        self.target_throughput = target_throughput
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.min_records = min_records
+        self.min_window = min_window
+        self.max_window = max_window or target_latency or 300
+        self.in_flight = in_flight
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.clock = clock
+        self.condition = Condition()
+        self.pending = 0
+        self.size = 0
+        self.first = None
+        self.last_flush = clock()
+        self.flushing = False
+        self.closed = False
+        # estimates: rows/s and upload seconds
+        self.rate = None
+        self.latency = 0.0
+        self.window, self.batch = self.plan()
+        self.flushes = 0
+        self.decisions = deque(maxlen=1000)
+        metrics.gauge('flush_window_seconds', lambda: self.window, listener=name)
+        metrics.gauge('flush_batch_records', lambda: self.batch, listener=name)
+        self.thread = None
+        if start:
+            self.thread = Thread(target=self._run, name=f'{name}_flusher', daemon=True)
+            self.thread.start()
+
+    def interval(self):
+        # the shortest time between flushes the uploads can keep up with
+        return self.latency / self.in_flight * self.headroom
+
+    def plan(self):
+        # (window seconds, batch records) from the current estimates
+        if self.target_throughput:
+            batch = self.target_throughput * max(self.latency, self.min_window) / self.in_flight
+            window = batch / self.rate if self.rate else self.max_window
+        else:
+            window = self.target_latency - self.latency
+            batch = self.rate * window if self.rate else self.max_records
+        window = min(max(window, self.interval(), self.min_window), self.max_window)
+        batch = int(min(max(batch, self.min_records), self.max_records))
+        return window, batch
+
+    def add(self, records=1, size=0):
+        # called by the ingest thread after buffering `records` rows; `size`
+        # is the size of the buffer they went to
+        with self.condition:
+            if not self.pending:
+                self.first = self.clock()
+                # the scheduler has a deadline again
+                self.condition.notify_all()
+            self.pending += records
+            self.size = max(self.size, size)
+            if self.pending >= self.batch or self.size >= self.max_bytes:
+                self.condition.notify_all()
+                # a full batch is waiting on an earlier flush still running
+                while self.thread and self.flushing and self.pending >= self.max_records and not self.closed:
+                    self.condition.wait()
+
+    def observe(self, seconds):
+        # upload latency of one flush, as measured by the sink
+        with self.condition:
+            self.latency += self.smoothing * (seconds - self.latency)
+            self.window, self.batch = self.plan()
+
+    def due(self, now):
+        if not self.pending:
+            return None
+        if self.pending >= self.max_records:
+            return 'max_records'
+        if self.size >= self.max_bytes:
+            return 'max_bytes'
+        if now >= self.deadline():
+            return 'batch' if self.pending >= self.batch else 'window'
+        return None
+
+    def deadline(self):
+        # when the pending rows are due, None to wait for add()
+        if not self.pending:
+            return None
+        deadline = self.first + self.window
+        if self.pending >= self.batch:
+            deadline = min(deadline, self.last_flush + self.interval())
+        return deadline
+
+    def poll(self, now=None, force=False):
+        # flushes if a limit was hit; returns the decision or None
+        with self.condition:
+            now = self.clock() if now is None else now
+            reason = 'close' if force and self.pending else self.due(now)
+            if reason is None:
+                return None
+            elapsed = max(now - self.last_flush, 1e-6)
+            rate = self.pending / elapsed
+            self.rate = rate if self.rate is None else self.rate + self.smoothing * (rate - self.rate)
+            decision = {'at': now, 'reason': reason, 'records': self.pending, 'bytes': self.size,
+                        'waited': round(now - self.first, 3), 'rate': round(self.rate, 1),
+                        'latency': round(self.latency, 3)}
+            self.window, self.batch = self.plan()
+            decision.update(window=round(self.window, 3), batch=self.batch)
+            self.pending = 0
+            self.size = 0
+            self.first = None
+            self.last_flush = now
+            self.flushing = True
+            self.decisions.append(decision)
+        try:
+            self.flush()
+        finally:
+            with self.condition:
+                self.flushing = False
+                self.flushes += 1
+                self.condition.notify_all()
+        return decision
+
+    def last(self):
+        return self.decisions[-1] if self.decisions else None
+
+    def stats(self):
+        with self.condition:
+            return {'flushes': self.flushes, 'pending': self.pending, 'window': round(self.window, 3),
+                    'batch': self.batch, 'rate': round(self.rate or 0.0, 1), 'latency': round(self.latency, 3)}
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.due(self.clock()):
+                    deadline = self.deadline()
+                    self.condition.wait(None if deadline is None else max(deadline - self.clock(), 0.001))
+                if self.closed:
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                print(e)
+
+    def close(self):
+        # stops the scheduler and flushes whatever is left
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+        self.poll(force=True)
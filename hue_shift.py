@@ -0,0 +1,143 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+def rgb_to_hsv(rgb):
+    # Translated from source of colorsys.rgb_to_hsv
+    # r,g,b should be a numpy arrays with values between 0 and 255
+    # rgb_to_hsv returns an array of floats between 0.0 and 1.0.
+    rgb = rgb.astype('float')
+    hsv = np.zeros_like(rgb)
+    # in case an RGBA array was passed, just copy the A channel
+    hsv[..., 3:] = rgb[..., 3:]
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = np.max(rgb[..., :3], axis=-1)
+    minc = np.min(rgb[..., :3], axis=-1)
+    hsv[..., 2] = maxc
+    mask = maxc != minc
+    hsv[mask, 1] = (maxc - minc)[mask] / maxc[mask]
+    rc = np.zeros_like(r)
+    gc = np.zeros_like(g)
+    bc = np.zeros_like(b)
+    rc[mask] = (maxc - r)[mask] / (maxc - minc)[mask]
+    gc[mask] = (maxc - g)[mask] / (maxc - minc)[mask]
+    bc[mask] = (maxc - b)[mask] / (maxc - minc)[mask]
+    hsv[..., 0] = np.select(
+        [r == maxc, g == maxc], [bc - gc, 2.0 + rc - bc], default=4.0 + gc - rc)
+    hsv[..., 0] = (hsv[..., 0] / 6.0) % 1.0
+    return hsv
+
+
+def hsv_to_rgb(hsv):
+    # Translated from source of colorsys.hsv_to_rgb
+    # h,s should be a numpy arrays with values between 0.0 and 1.0
+    # v should be a numpy array with values between 0.0 and 255.0
+    # hsv_to_rgb returns an array of uints between 0 and 255.
+    rgb = np.empty_like(hsv)
+    rgb[..., 3:] = hsv[..., 3:]
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    i = (h * 6.0).astype('uint8')
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    conditions = [s == 0.0, i == 1, i == 2, i == 3, i == 4, i == 5]
+    rgb[..., 0] = np.select(conditions, [v, q, p, p, t, v], default=v)
+    rgb[..., 1] = np.select(conditions, [v, v, v, q, p, p], default=t)
+    rgb[..., 2] = np.select(conditions, [v, p, t, v, v, q], default=p)
+    return rgb.astype('uint8')
+
+
+def shift_hue(arr, hout):
+    hsv = rgb_to_hsv(arr)
+    hsv[..., 0] = hout
+    rgb = hsv_to_rgb(hsv)
+    return rgb
+
+
+class HueShifter():
+    # With a single output hue every pixel goes through the same branch of
+    # hsv_to_rgb, so each channel is v * (1 - s * k) with k in {0, f, 1 - f, 1}
+    # fixed by the hue. Only v (max channel) and s depend on the pixel: they
+    # are computed once from the decoded base image and reused for every hue.
+    #
+    # lut=True (default) evaluates the exact float64 expressions of
+    # hsv_to_rgb once per (max, max - min) pair and gathers the result, so
+    # the output is identical to shift_hue. lut=False runs the same formula
+    # in float32 in place, which may differ by one level on rounding edges.
+    def __init__(self, path='avatar.png'):
+        self.path = path
+        arr = np.array(Image.open(path).convert('RGBA'))
+        self.shape = arr.shape
+        rgb = arr[..., :3]
+        maxc = rgb.max(axis=-1)
+        delta = maxc - rgb.min(axis=-1)
+        self.alpha = arr[..., 3].copy()
+        self.index = maxc.astype(np.intp) * 256 + delta
+        self.v = maxc.astype(np.float32)
+        self.s = np.zeros(maxc.shape, dtype=np.float32)
+        np.divide(delta, maxc, out=self.s, where=delta != 0, dtype=np.float32)
+        self.out = np.empty(self.shape, dtype=np.uint8)
+        self.out[..., 3] = self.alpha
+        self._scratch = np.empty(maxc.shape, dtype=np.float32)
+        self._grid = None
+
+    def factors(self, hue):
+        h = np.float64(hue)
+        i = np.uint8(h * 6.0)
+        f = (h * 6.0) - i
+        # k per (r, g, b) as picked by hsv_to_rgb: v -> 0, p -> 1, q -> f, t -> 1 - f
+        return (
+            (0, 1 - f, 1), (f, 0, 1), (1, 0, 1 - f),
+            (1, f, 0), (1 - f, 1, 0), (0, 1, f),
+        )[int(i) % 6]
+
+    def lut(self, hue):
+        if self._grid is None:
+            v = np.repeat(np.arange(256, dtype='float64'), 256)
+            delta = np.tile(np.arange(256, dtype='float64'), 256)
+            s = np.zeros_like(v)
+            valid = (delta != 0) & (delta <= v)
+            s[valid] = delta[valid] / v[valid]
+            self._grid = (v, s)
+        v, s = self._grid
+        hsv = np.empty((v.size, 3), dtype='float64')
+        hsv[:, 0] = hue
+        hsv[:, 1] = s
+        hsv[:, 2] = v
+        return hsv_to_rgb(hsv)
+
+    def shift(self, hue, lut=True):
+        out = self.out
+        if lut:
+            table = self.lut(hue)
+            for c in range(3):
+                np.take(table[:, c], self.index, out=out[..., c])
+            return out
+        ks = self.factors(hue)
+        scratch = self._scratch
+        for c, k in enumerate(ks):
+            # v * (1 - s * k), truncated like astype('uint8')
+            np.multiply(self.s, np.float32(k), out=scratch)
+            np.subtract(np.float32(1.0), scratch, out=scratch)
+            np.multiply(scratch, self.v, out=scratch)
+            out[..., c] = scratch
+        return out
+
+    def render_png(self, hue, lut=True):
+        buffer = BytesIO()
+        Image.fromarray(self.shift(hue, lut=lut), 'RGBA').save(buffer, format='PNG')
+        buffer.seek(0)
+        return buffer
+
+
+_shifters = {}
+
+
+def get_shifter(path='avatar.png'):
+    if path not in _shifters:
+        _shifters[path] = HueShifter(path)
+    return _shifters[path]
@@ -0,0 +1,113 @@
+import os
+
+import tweepy
+
+import flush
+import metrics
+import seen
+import terms
+import tweetjson
+
+
+SPOOL_DIR = os.environ.get('TB_SPOOL_DIR')
+# 'tag': one row per matching term in `datasource`, 'sink': a datasource per term
+ROUTE = os.environ.get('STREAM_ROUTE', 'tag')
+# rows/s to size flushes for; by default they are sized for latency
+TARGET_THROUGHPUT = float(os.environ.get('FLUSH_TARGET_THROUGHPUT', 0)) or None
+PAYLOADS = metrics.counter('stream_payloads_total')
+DUPLICATES = metrics.counter('stream_duplicates_total')
+
+_seen_ids = None
+
+
+def get_seen_ids():
+    # ids already ingested, kept across reconnects and, with SEEN_IDS_PATH, runs;
+    # a repeated tweet is dropped before it is parsed or scored
+    global _seen_ids
+    if _seen_ids is None:
+        seen_ids = seen.SeenIds(max_age=int(os.environ.get('SEEN_IDS_MAX_AGE', 86400)), path=os.environ.get('SEEN_IDS_PATH'))
+        metrics.gauge('seen_ids', seen_ids.__len__)
+        metrics.gauge('dedupe_rate', lambda: seen_ids.stats()['dedupe_rate'])
+        _seen_ids = seen_ids
+    return _seen_ids
+
+
+class StreamListener(tweepy.StreamListener):
+    # What the stream scripts share: the tracked terms, a sink for
+    # `datasource` (and one per term with route='sink'), flushes and the
+    # seen ids. Scripts add their sink in new_sink(name), where a record's
+    # term is in term(record), and on_data.
+
+    datasource = 'tweets'
+
+    def __init__(self, name, api, search_term, max_wait_seconds=10,
+                 max_wait_records=10000,
+                 max_wait_bytes=1024*1024*1, route='tag', target_throughput=None):
+        self.name = name
+        self.records = 0
+        self.api = api
+        # one connection can track several terms
+        self.track = [search_term] if isinstance(search_term, str) else list(search_term)
+        self.search_term = self.track[0]
+        self.tagger = terms.TermTagger(self.track)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_wait_records = max_wait_records
+        self.max_wait_bytes = max_wait_bytes
+        self.seen_ids = get_seen_ids()
+        # every flush is made by this controller's thread, which tunes the
+        # window and batch size from the rate and the upload latency
+        self.flusher = flush.FlushController(self.flush, name=name, target_latency=max_wait_seconds,
+                                             target_throughput=target_throughput, max_records=max_wait_records,
+                                             max_bytes=max_wait_bytes, max_window=max_wait_seconds)
+        self.route = route
+        self.sink = self.new_sink(self.datasource)
+        self.term_sinks = {}
+        self.tr_timer = None
+        self.tr_timer_start = None
+
+    def new_sink(self, name):
+        # sinks report their upload latency to self.flusher.observe
+        raise NotImplementedError
+
+    def term(self, record):
+        raise NotImplementedError
+
+    def sink_for(self, term):
+        if self.route != 'sink' or not term:
+            return self.sink
+        sink = self.term_sinks.get(term)
+        if sink is None:
+            sink = self.term_sinks[term] = self.new_sink(terms.datasource_name(self.datasource, term))
+        return sink
+
+    def sinks(self):
+        return [self.sink] + list(self.term_sinks.values())
+
+    def duplicate(self, raw_data):
+        # counts the payload; True when its tweet was already ingested
+        PAYLOADS.inc()
+        if self.seen_ids.duplicate(tweetjson.tweet_id(raw_data)):
+            DUPLICATES.inc()
+            return True
+        return False
+
+    def append(self, record):
+        if self.records % 100 == 0:
+            print('append')
+        sink = self.sink_for(self.term(record))
+        sink.append(record)
+        self.records += 1
+        self.flusher.add(1, sink.tell())
+
+    def flush(self):
+        # runs on the flusher thread
+        print(f'flush {self.flusher.last()}')
+        for sink in self.sinks():
+            sink.flush()
+        print(f'seen ids {self.seen_ids.stats()}')
+
+    def close(self):
+        self.flusher.close()
+        for sink in self.sinks():
+            sink.close()
+        self.seen_ids.save()
@@ -0,0 +1,214 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+
+
+# Stage timing only happens while `enabled` is set: clock() returns 0 and
+# Histogram.since(0) returns straight away, so a disabled hot path pays
+# two no-op calls per stage.
+enabled = False
+
+# seconds, roughly x2.5 apart, from 10us to 30s
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def clock():
+    return time.perf_counter() if enabled else 0.0
+
+
+def key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def series(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Counter():
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        if enabled:
+            self.value += n
+
+
+class Histogram():
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def since(self, start):
+        # observes the time since a clock() reading and returns a new one
+        if not start:
+            return 0.0
+        now = time.perf_counter()
+        self.observe(now - start)
+        return now
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+class Registry():
+    # Counters and histograms are created once (at import or in __init__)
+    # and updated in place; gauges are callables read at snapshot time, so
+    # things like buffer sizes cost nothing until somebody looks.
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def counter(self, name, **labels):
+        with self.lock:
+            return self.counters.setdefault(key(name, labels), Counter())
+
+    def histogram(self, name, **labels):
+        with self.lock:
+            return self.histograms.setdefault(key(name, labels), Histogram())
+
+    def gauge(self, name, fn, **labels):
+        with self.lock:
+            self.gauges[key(name, labels)] = fn
+
+    def read_gauges(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = {}
+        for k, fn in gauges:
+            try:
+                values[k] = fn()
+            except Exception as e:
+                print(e)
+        return values
+
+    def snapshot(self):
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        return {
+            'time': time.time(),
+            'counters': {series(*k): c.value for k, c in counters},
+            'gauges': {series(*k): v for k, v in self.read_gauges().items()},
+            'histograms': {series(*k): h.snapshot() for k, h in histograms},
+        }
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        for (name, labels), c in counters:
+            lines.append(f'{series(name, labels)} {c.value}')
+        for (name, labels), value in self.read_gauges().items():
+            lines.append(f'{series(name, labels)} {value}')
+        for (name, labels), h in histograms:
+            seen = 0
+            for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                seen += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{series(name + "_bucket", labels + (("le", le),))} {seen}')
+            lines.append(f'{series(name + "_sum", labels)} {h.sum}')
+            lines.append(f'{series(name + "_count", labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        # GET /metrics (Prometheus text) and /metrics.json
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.render(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(registry.snapshot()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, name='metrics_server', daemon=True).start()
+        return server
+
+    def write_every(self, path, interval):
+        stop = Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.write(path)
+                except Exception as e:
+                    print(e)
+
+        Thread(target=loop, name='metrics_snapshots', daemon=True).start()
+        return stop
+
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+gauge = registry.gauge
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def start():
+    # METRICS_PORT serves the registry over HTTP, METRICS_FILE gets a JSON
+    # snapshot every METRICS_INTERVAL seconds; either one turns timing on
+    port = os.environ.get('METRICS_PORT')
+    path = os.environ.get('METRICS_FILE')
+    if port:
+        registry.serve(int(port), os.environ.get('METRICS_HOST', '127.0.0.1'))
+        print(f'metrics on :{port}/metrics')
+    if path:
+        registry.write_every(path, float(os.environ.get('METRICS_INTERVAL', 15)))
+        print(f'metrics snapshots to {path}')
+    if port or path:
+        enable()
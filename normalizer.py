@@ -0,0 +1,27 @@
+import re
+import string
+
+
+# Reference expression, kept for non-ASCII text where \w and \S are Unicode aware:
+#   " ".join(re.sub("([^0-9A-Za-z \t])|(\w+:\/\/\S+)", "", text).split())
+PATTERN = re.compile(r"([^0-9A-Za-z \t])|(\w+://\S+)")
+
+# On ASCII text a URL match can only start at the first letter or digit of the
+# word in front of "://" (a leading "_" is removed by the first alternative),
+# so URLs can be cut first and every other disallowed character deleted with
+# a single bytes.translate.
+URL = re.compile(r"[0-9A-Za-z]\w*://\S+")
+ALLOWED = string.ascii_letters + string.digits + ' \t'
+DELETE = bytes(c for c in range(128) if chr(c) not in ALLOWED)
+
+
+def normalize(text):
+    if text.isascii():
+        if '://' in text:
+            text = URL.sub('', text)
+        return b' '.join(text.encode('ascii').translate(None, DELETE).split()).decode('ascii')
+    return ' '.join(PATTERN.sub('', text).split())
+
+
+def normalize_batch(texts):
+    return [normalize(text) for text in texts]
@@ -0,0 +1,235 @@
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Thread
+
+import metrics
+import normalizer
+import scoring
+import terms
+import tweetjson
+
+
+_STOP = object()
+_cache = None
+
+PARSE_SECONDS = metrics.histogram('stage_seconds', stage='parse')
+NORMALIZE_SECONDS = metrics.histogram('stage_seconds', stage='normalize')
+# one observation per batch scored in a worker process
+SCORE_BATCH_SECONDS = metrics.histogram('stage_seconds', stage='score_batch')
+STAGES = {'parse': PARSE_SECONDS, 'normalize': NORMALIZE_SECONDS, 'score_batch': SCORE_BATCH_SECONDS}
+
+
+class StageSeconds():
+    # Stands in for a stage histogram in the worker processes, whose
+    # metrics are never exported: the seconds go back with the batch and
+    # the collector observes them in the parent.
+    def __init__(self):
+        self.seconds = []
+
+    def since(self, start):
+        now = time.perf_counter()
+        self.seconds.append(now - start)
+        return now
+
+
+def parse_payload(raw_data, search_term, tagger=None, stages=None):
+    # with a tagger the search_term field is the list of matching terms;
+    # `stages` maps stage names to StageSeconds in the workers
+    if stages:
+        parse_seconds, normalize_seconds = stages['parse'], stages['normalize']
+        start = time.perf_counter()
+    else:
+        parse_seconds, normalize_seconds = PARSE_SECONDS, NORMALIZE_SECONDS
+        start = metrics.clock()
+    head = tweetjson.decode_head(raw_data)
+    if head is None:
+        return
+    id, created_at, text = head
+    date = tweetjson.format_date(str(created_at))
+    if tagger:
+        search_term = tagger.tag(text)
+    start = parse_seconds.since(start)
+    text = normalizer.normalize(text)
+    normalize_seconds.since(start)
+    return [id, date, text, search_term]
+
+
+def records(row, polarity):
+    # one record per matching term
+    if isinstance(row[3], list):
+        return [row[:3] + [term, polarity] for term in row[3]]
+    return [row + [polarity]]
+
+
+def _init_worker():
+    global _cache
+    _cache = scoring.PolarityCache()
+    scoring.get_scorer()
+
+
+def parse_batch(payloads, search_term, track=None, timed=False):
+    # runs in the worker processes; returns the records and, when timed,
+    # the seconds of every stage for the parent to observe
+    if _cache is None:
+        _init_worker()
+    tagger = terms.get_tagger(track) if track else None
+    stages = {name: StageSeconds() for name in STAGES} if timed else None
+    rows = []
+    for raw_data in payloads:
+        try:
+            row = parse_payload(raw_data, search_term, tagger, stages)
+        except Exception as e:
+            print(e)
+            continue
+        if row is not None:
+            rows.append(row)
+    start = time.perf_counter()
+    try:
+        polarities = _cache.score_batch([row[2] for row in rows])
+    except Exception as e:
+        print(e)
+        polarities = [0] * len(rows)
+    if stages:
+        stages['score_batch'].since(start)
+    timings = {name: stage.seconds for name, stage in stages.items()} if stages else None
+    return [record for row, polarity in zip(rows, polarities) for record in records(row, polarity)], timings
+
+
+class ScoringPipeline():
+    # Parses and scores raw stream payloads in a pool of worker processes.
+    # put() only enqueues, so the thread reading the stream never waits for
+    # scoring. Payloads are batched (batch_size or whatever arrived within
+    # max_batch_wait seconds) and records reach on_record in arrival order.
+    # Backpressure: at most max_pending payloads are queued and max_in_flight
+    # batches are scoring or waiting for on_record; past that put() blocks,
+    # or drops the payload when block is False. With `track`, the list of
+    # tracked terms, each tweet becomes one record per matching term.
+
+    def __init__(self, on_record, search_term, workers=2, batch_size=200,
+                 max_batch_wait=0.5, max_pending=10000, max_in_flight=None,
+                 block=True, track=None):
+        self.on_record = on_record
+        self.search_term = search_term
+        self.track = track
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+        self.block = block
+        self.payloads = queue.Queue(maxsize=max_pending)
+        self.batches = queue.Queue(maxsize=max_in_flight or workers * 2)
+        self.pool = self.new_pool()
+        self.restarts = 0
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        for name, value in self.stats().items():
+            metrics.gauge(f'pipeline_{name}', lambda name=name: self.stats()[name])
+        self.dispatcher = Thread(target=self._dispatch, name='scoring_dispatcher', daemon=True)
+        self.collector = Thread(target=self._collect, name='scoring_collector', daemon=True)
+        self.dispatcher.start()
+        self.collector.start()
+
+    def new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def submit(self, batch):
+        # a worker that died breaks the whole pool: its batch is dropped and
+        # the next ones go to a fresh pool
+        try:
+            return self.pool.submit(parse_batch, batch, self.search_term, self.track, metrics.enabled)
+        except BrokenProcessPool as e:
+            print(f'scoring pool broken, restarting: {e}')
+            self.dropped += len(batch)
+            self.pool.shutdown(wait=False)
+            self.pool = self.new_pool()
+            self.restarts += 1
+        except Exception as e:
+            print(e)
+            self.dropped += len(batch)
+
+    def put(self, raw_data):
+        self.received += 1
+        try:
+            self.payloads.put_nowait(raw_data)
+            return True
+        except queue.Full:
+            if not self.block:
+                self.dropped += 1
+                return False
+        self.blocked += 1
+        start = time.monotonic()
+        self.payloads.put(raw_data)
+        self.blocked_seconds += time.monotonic() - start
+        return True
+
+    def _dispatch(self):
+        # _STOP always reaches the collector, so close() returns even if
+        # this thread fails
+        try:
+            stop = False
+            while not stop:
+                item = self.payloads.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_batch_wait
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self.payloads.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                future = self.submit(batch)
+                if future is not None:
+                    self.batches.put((len(batch), future))
+        finally:
+            self.batches.put(_STOP)
+
+    def _collect(self):
+        while True:
+            item = self.batches.get()
+            if item is _STOP:
+                break
+            size, future = item
+            try:
+                records, timings = future.result()
+            except Exception as e:
+                print(e)
+                self.dropped += size
+                continue
+            for name, seconds in (timings or {}).items():
+                for value in seconds:
+                    STAGES[name].observe(value)
+            for record in records:
+                self.on_record(record)
+            self.processed += size
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'pending': self.payloads.qsize(),
+            'in_flight': self.batches.qsize(),
+            'blocked': self.blocked,
+            'blocked_seconds': round(self.blocked_seconds, 3),
+            'restarts': self.restarts,
+        }
+
+    def close(self):
+        # drain whatever is queued before shutting the workers down
+        if self.dispatcher.is_alive():
+            self.payloads.put(_STOP)
+        self.dispatcher.join()
+        self.collector.join()
+        self.pool.shutdown()
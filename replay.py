@@ -0,0 +1,94 @@
+import argparse
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+
+TIMESTAMP_MS = re.compile(r'"timestamp_ms"\s*:\s*"?(\d+)')
+CREATED_AT = re.compile(r'"created_at"\s*:\s*"([^"]+)"')
+
+
+def timestamp(raw_data):
+    # seconds since the epoch of a raw payload, without decoding all of it
+    match = TIMESTAMP_MS.search(raw_data)
+    if match:
+        return int(match.group(1)) / 1000
+    match = CREATED_AT.search(raw_data)
+    if match:
+        return parsedate_to_datetime(match.group(1)).timestamp()
+
+
+class ReplaySource():
+    # Replays recorded stream payloads, one raw tweet JSON per line (what
+    # on_data receives), in one of three modes:
+    #   fast      as fast as the consumer takes them
+    #   rate      `rate` payloads per second
+    #   original  keeping the gaps between the payloads' timestamp_ms (or
+    #             created_at), divided by `speed`
+    # Pacing is against a deadline computed from the start, so a slow
+    # consumer catches up instead of drifting.
+    def __init__(self, path, mode='fast', rate=None, speed=1.0, loops=1, clock=time.monotonic, sleep=time.sleep):
+        if mode not in ('fast', 'rate', 'original'):
+            raise ValueError(f'unknown replay mode {mode}')
+        if mode == 'rate' and not rate:
+            raise ValueError('rate mode needs a rate')
+        self.path = path
+        self.mode = mode
+        self.rate = rate
+        self.speed = speed
+        self.loops = loops
+        self.clock = clock
+        self.sleep = sleep
+        self.sent = 0
+        self.lag = 0.0
+
+    def lines(self):
+        for _ in range(self.loops):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if line:
+                        yield line
+
+    def __iter__(self):
+        start = self.clock()
+        first = None
+        for raw_data in self.lines():
+            if self.mode == 'rate':
+                deadline = start + self.sent / self.rate
+            elif self.mode == 'original':
+                ts = timestamp(raw_data)
+                if first is None and ts is not None:
+                    first = ts
+                deadline = start + (ts - first) / self.speed if ts is not None else self.clock()
+            else:
+                deadline = None
+            if deadline is not None:
+                delay = deadline - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+                else:
+                    self.lag = max(self.lag, -delay)
+            self.sent += 1
+            yield raw_data
+
+
+def replay(listener, source):
+    # feeds every payload to listener.on_data, returns (payloads, seconds)
+    start = time.perf_counter()
+    count = 0
+    for raw_data in source:
+        listener.on_data(raw_data)
+        count += 1
+    return count, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print recorded stream payloads at a controlled rate')
+    parser.add_argument('path')
+    parser.add_argument('--mode', choices=('fast', 'rate', 'original'), default='fast')
+    parser.add_argument('--rate', type=float)
+    parser.add_argument('--speed', type=float, default=1.0)
+    args = parser.parse_args()
+    for raw_data in ReplaySource(args.path, args.mode, rate=args.rate, speed=args.speed):
+        print(raw_data, flush=True)
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+
+class RollingPolarity():
+    # Ring buffer of per-bucket polarity sums and tweet counts. A tweet lands
+    # in slot (timestamp // bucket_seconds) % size; a slot still holding an
+    # older bucket is cleared first, so add() is O(1) and the buffer never
+    # grows. Sized to cover `series` moving-average points of `average`
+    # buckets each.
+    #
+    # Mirrors what avatar.py reads from the Tinybird pipes, on the same
+    # -100..100 scale:
+    #   current()         mean polarity of the last `window` buckets
+    #   moving_average()  [{'date', 'polarity'}], oldest first, one point per
+    #                     bucket, each the mean of its trailing `average`
+    #                     buckets; what create_stripes draws
+    def __init__(self, bucket_seconds=3600, series=150, average=24, window=24, scale=100,
+                 path=None, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.series = series
+        self.average = average
+        self.window = window
+        self.scale = scale
+        self.size = series + max(average, window) - 1
+        self.path = path
+        self.clock = clock
+        self.clear()
+        self.load()
+
+    def clear(self):
+        self.epochs = [None] * self.size
+        self.sums = [0.0] * self.size
+        self.counts = [0] * self.size
+        self.tweets = 0
+
+    def config(self):
+        return {'bucket_seconds': self.bucket_seconds, 'size': self.size}
+
+    def bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def add(self, polarity, timestamp=None):
+        if polarity is None:
+            return
+        epoch = self.bucket(self.clock() if timestamp is None else timestamp)
+        latest = self.bucket(self.clock())
+        if epoch <= latest - self.size:
+            return
+        slot = epoch % self.size
+        if self.epochs[slot] != epoch:
+            if self.epochs[slot] is not None and self.epochs[slot] > epoch:
+                return
+            self.epochs[slot] = epoch
+            self.sums[slot] = 0.0
+            self.counts[slot] = 0
+        self.sums[slot] += polarity
+        self.counts[slot] += 1
+        self.tweets += 1
+
+    def add_batch(self, polarities, timestamps):
+        for polarity, timestamp in zip(polarities, timestamps):
+            self.add(polarity, timestamp)
+
+    def totals(self, epoch):
+        slot = epoch % self.size
+        if self.epochs[slot] != epoch:
+            return 0.0, 0
+        return self.sums[slot], self.counts[slot]
+
+    def is_empty(self, now=None):
+        latest = self.bucket(self.clock() if now is None else now)
+        return not any(self.totals(epoch)[1] for epoch in range(latest - self.size + 1, latest + 1))
+
+    def current(self, now=None):
+        latest = self.bucket(self.clock() if now is None else now)
+        total, count = 0.0, 0
+        for epoch in range(latest - self.window + 1, latest + 1):
+            s, c = self.totals(epoch)
+            total += s
+            count += c
+        if not count:
+            return None
+        return round(total / count * self.scale, 4)
+
+    def moving_average(self, now=None):
+        # running sums over the ring, one pass; buckets before the first
+        # tweet are left out and windows without tweets repeat the last point
+        latest = self.bucket(self.clock() if now is None else now)
+        first = latest - self.series + 1
+        total, count = 0.0, 0
+        for epoch in range(first - self.average + 1, first):
+            s, c = self.totals(epoch)
+            total += s
+            count += c
+        rows = []
+        last = None
+        for epoch in range(first, latest + 1):
+            s, c = self.totals(epoch)
+            total += s
+            count += c
+            if epoch > first:
+                s, c = self.totals(epoch - self.average)
+                total -= s
+                count -= c
+            if count:
+                last = round(total / count * self.scale, 4)
+            if last is not None:
+                date = datetime.fromtimestamp(epoch * self.bucket_seconds, timezone.utc)
+                rows.append({'date': date.strftime('%Y-%m-%d %H:%M:%S'), 'polarity': last})
+        return rows
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except Exception as e:
+            print(e)
+            return
+        if state.get('config') != self.config():
+            return
+        self.epochs, self.sums, self.counts = state['epochs'], state['sums'], state['counts']
+        self.tweets = state.get('tweets', 0)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'config': self.config(), 'epochs': self.epochs, 'sums': self.sums,
+                       'counts': self.counts, 'tweets': self.tweets}, f)
+        os.replace(tmp, self.path)
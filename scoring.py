@@ -0,0 +1,208 @@
+import json
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Text already passed through the tweet normalizer only holds ASCII letters,
+# digits and blanks, so pattern's tokenizer boils down to str.split() and none
+# of the punctuation, contraction or emoticon rules can fire.
+NORMALIZED = re.compile(r'[0-9A-Za-z \t]*')
+
+
+class PolarityScorer():
+    def __init__(self, lexicon=None):
+        if lexicon is None:
+            from textblob.en import sentiment as lexicon
+        if not dict.__len__(lexicon):
+            lexicon.load()
+        self.lexicon = lexicon
+        self.negations = frozenset(lexicon.negations)
+
+        words = list(dict.keys(lexicon))
+        self.index = {w: i for i, w in enumerate(words)}
+        scores = np.array([dict.__getitem__(lexicon, w)[None] for w in words], dtype='float64').reshape(-1, 3)
+        self.polarity = scores[:, 0]
+        self.intensity = scores[:, 2]
+        self.is_modifier = np.array([any(pos in dict.__getitem__(lexicon, w) for pos in lexicon.modifiers) for w in words], dtype=bool)
+        self.is_negation = np.array([w in self.negations for w in words], dtype=bool)
+        self.is_ly = np.array([bool(lexicon.modifier(w)) for w in words], dtype=bool)
+
+        # plain lists index faster than ndarrays inside the per-token loop
+        self._p = self.polarity.tolist()
+        self._i = self.intensity.tolist()
+        self._mod = self.is_modifier.tolist()
+        self._neg = self.is_negation.tolist()
+        self._ly = self.is_ly.tolist()
+
+    def assess(self, words):
+        # Same rules as pattern's Sentiment.assessments() restricted to what
+        # can show up in normalized text. Returns the polarity of each
+        # assessment and whether it was negated.
+        index, P, I, MOD, NEG, LY = self.index, self._p, self._i, self._mod, self._neg, self._ly
+        negations = self.negations
+        ps = []
+        negs = []
+        last_i = 1.0
+        m = None
+        n = None
+        for w in words:
+            k = index.get(w)
+            if k is not None:
+                if m is None:
+                    ps.append(P[k])
+                    negs.append(False)
+                else:
+                    ps[-1] = max(-1.0, min(P[k] * last_i, +1.0))
+                last_i = I[k]
+                if n is not None:
+                    last_i = 1.0 / last_i
+                    negs[-1] = True
+                m = k if MOD[k] else None
+                n = w if NEG[k] else None
+            else:
+                if w in negations:
+                    n = w
+                elif n and len(w.strip("'")) > 1:
+                    n = None
+                if n is not None and m is not None and LY[m]:
+                    negs[-1] = True
+                    n = None
+                elif m is not None and len(w) > 2:
+                    m = None
+        return ps, negs
+
+    def score_batch(self, texts):
+        owners = []
+        ps = []
+        negs = []
+        fallback = {}
+        for j, text in enumerate(texts):
+            if NORMALIZED.fullmatch(text) is None:
+                fallback[j] = round(self.lexicon(text)[0], 4)
+                continue
+            p, n = self.assess(text.lower().split())
+            ps.extend(p)
+            negs.extend(n)
+            owners.extend([j] * len(p))
+
+        size = len(texts)
+        owners = np.array(owners, dtype=np.intp)
+        p = np.array(ps, dtype='float64')
+        p[np.array(negs, dtype=bool)] *= -0.5
+        # bincount adds the weights in order, so sums are bit-identical to
+        # pattern's running total
+        sums = np.bincount(owners, weights=p, minlength=size)
+        counts = np.bincount(owners, minlength=size)
+        polarities = sums / np.maximum(counts, 1)
+
+        result = [round(x, 4) for x in polarities.tolist()]
+        for j, polarity in fallback.items():
+            result[j] = polarity
+        return result
+
+    def score(self, text):
+        return self.score_batch([text])[0]
+
+
+_scorer = None
+
+
+def get_scorer():
+    global _scorer
+    if _scorer is None:
+        _scorer = PolarityScorer()
+    return _scorer
+
+
+def score_batch(texts):
+    return get_scorer().score_batch(texts)
+
+
+def score(text):
+    return get_scorer().score(text)
+
+
+class PolarityCache():
+    def __init__(self, max_size=100000, path=None, scorer=None):
+        self.max_size = max_size
+        self.path = path
+        self.scorer = scorer
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, text):
+        polarity = self.entries.get(text)
+        if polarity is None:
+            self.misses += 1
+            return
+        self.entries.move_to_end(text)
+        self.hits += 1
+        return polarity
+
+    def put(self, text, polarity):
+        if polarity is None:
+            return
+        self.entries[text] = polarity
+        self.entries.move_to_end(text)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def score(self, text):
+        polarity = self.get(text)
+        if polarity is None:
+            polarity = (self.scorer or get_scorer()).score(text)
+            self.put(text, polarity)
+        return polarity
+
+    def score_batch(self, texts):
+        result = [self.get(text) for text in texts]
+        # score each distinct miss once, retweets within a batch included
+        missing = list(OrderedDict.fromkeys(text for text, polarity in zip(texts, result) if polarity is None))
+        if missing:
+            scored = dict(zip(missing, (self.scorer or get_scorer()).score_batch(missing)))
+            for text, polarity in scored.items():
+                self.put(text, polarity)
+            result = [scored[text] if polarity is None else polarity for text, polarity in zip(texts, result)]
+        return result
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate(), 4),
+        }
+
+    def load(self, path=None):
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(e)
+            return
+        # oldest first, so the most recently used entries survive a smaller max_size
+        for text, polarity in entries:
+            self.put(text, polarity)
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp, path)
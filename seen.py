@@ -0,0 +1,116 @@
+import os
+import time
+from array import array
+from bisect import bisect_left
+
+
+# Tweet ids are snowflakes: the bits above the low 22 are milliseconds since
+# this epoch, so every id carries the time it was created.
+TWEPOCH_MS = 1288834974657
+
+
+def id_time(tweet_id):
+    return ((tweet_id >> 22) + TWEPOCH_MS) / 1000
+
+
+def time_id(timestamp):
+    # the smallest id created at or after timestamp
+    return max(int(timestamp * 1000) - TWEPOCH_MS, 0) << 22
+
+
+class SeenIds():
+    # Ids of the tweets already ingested, 8 bytes each. New ids collect in a
+    # small set and are merged into a sorted array('q') every `merge_every`
+    # ids; ids arrive roughly in time order, so a merge appends to the array
+    # and only re-sorts the few out-of-order ids at its tail. Lookups are a
+    # set probe plus a bisect.
+    #
+    # Since ids sort by time, expiry cuts the front of the array: ids older
+    # than max_age seconds are dropped, and past max_ids the oldest go
+    # first. An expired id counts as new again. With a path the array is
+    # loaded on start and written by save().
+    def __init__(self, max_age=86400, max_ids=2000000, merge_every=4096, path=None, clock=time.time):
+        self.max_age = max_age
+        self.max_ids = max_ids
+        self.merge_every = merge_every
+        self.path = path
+        self.clock = clock
+        self.ids = array('q')
+        self.pending = set()
+        self.checked = 0
+        self.duplicates = 0
+        self.load()
+
+    def __contains__(self, tweet_id):
+        if tweet_id in self.pending:
+            return True
+        i = bisect_left(self.ids, tweet_id)
+        return i < len(self.ids) and self.ids[i] == tweet_id
+
+    def __len__(self):
+        return len(self.ids) + len(self.pending)
+
+    def add(self, tweet_id):
+        # True when the id is new (and now recorded), False for a duplicate
+        self.checked += 1
+        ids = self.ids
+        if tweet_id in self.pending or (ids and tweet_id <= ids[-1] and tweet_id in self):
+            self.duplicates += 1
+            return False
+        self.pending.add(tweet_id)
+        if len(self.pending) >= self.merge_every:
+            self.merge()
+        return True
+
+    def duplicate(self, tweet_id):
+        # payloads without an id (control messages) are never duplicates
+        return tweet_id is not None and not self.add(tweet_id)
+
+    def merge(self):
+        if self.pending:
+            pending = sorted(self.pending)
+            self.pending = set()
+            if not self.ids or pending[0] > self.ids[-1]:
+                self.ids.extend(pending)
+            else:
+                i = bisect_left(self.ids, pending[0])
+                tail = sorted(self.ids[i:].tolist() + pending)
+                del self.ids[i:]
+                self.ids.extend(tail)
+        self.expire()
+
+    def expire(self, now=None):
+        cutoff = bisect_left(self.ids, time_id((self.clock() if now is None else now) - self.max_age))
+        cutoff = max(cutoff, len(self.ids) - self.max_ids)
+        if cutoff > 0:
+            del self.ids[:cutoff]
+
+    def stats(self):
+        return {
+            'ids': len(self),
+            'bytes': self.ids.itemsize * len(self.ids),
+            'checked': self.checked,
+            'duplicates': self.duplicates,
+            'dedupe_rate': round(self.duplicates / self.checked, 4) if self.checked else 0.0,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                self.ids.frombytes(f.read())
+        except Exception as e:
+            print(e)
+            self.ids = array('q')
+            return
+        self.expire()
+
+    def save(self):
+        if not self.path:
+            return
+        self.merge()
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as f:
+            self.ids.tofile(f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,135 @@
+import os
+import time
+from threading import Lock
+
+
+def segment_pid(name):
+    # <time_ns>-<pid>-<sequence>.open
+    try:
+        return int(name.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Segment():
+    def __init__(self, spool, path):
+        self.spool = spool
+        self.path = path
+        self.file = open(path, 'ab')
+        self.last_sync = time.monotonic()
+
+    def write(self, data):
+        self.file.write(data)
+        # fsync in batches rather than per row
+        if time.monotonic() - self.last_sync >= self.spool.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def seal(self):
+        self.sync()
+        self.file.close()
+        if not os.path.getsize(self.path):
+            os.remove(self.path)
+            return
+        path = self.path[:-len(Spool.OPEN)] + Spool.SEALED
+        os.replace(self.path, path)
+        return path
+
+
+class Spool():
+    # Append-only local spool. Every encoded row goes to the open segment
+    # before it is buffered for upload; a segment is sealed when its buffer
+    # is flushed and deleted (acknowledged) only after the upload succeeded.
+    # Whatever is left on disk after a crash or a failed upload is backlog.
+    #
+    # Segment names carry the pid of the process writing them, and only
+    # segments of processes that are gone are sealed on start. Within a
+    # process, get_spool() hands every sink the same Spool for a directory,
+    # so a sink created after a reconnect never claims segments an older
+    # sink is still replaying.
+    OPEN = '.open'
+    SEALED = '.seg'
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = Lock()
+        self.inflight = set()
+        self.sequence = 0
+        os.makedirs(path, exist_ok=True)
+        # segments still open by a process that died are sealed; this
+        # process has not opened any yet, so one with our pid is stale too
+        for name in os.listdir(path):
+            if not name.endswith(self.OPEN):
+                continue
+            pid = segment_pid(name)
+            if pid == os.getpid() or not pid_alive(pid):
+                Segment(self, os.path.join(path, name)).seal()
+
+    def open_segment(self):
+        with self.lock:
+            self.sequence += 1
+            name = f'{time.time_ns():020d}-{os.getpid()}-{self.sequence:06d}{self.OPEN}'
+        return Segment(self, os.path.join(self.path, name))
+
+    def seal(self, segment):
+        path = segment.seal()
+        if path:
+            with self.lock:
+                self.inflight.add(path)
+        return path
+
+    def ack(self, path):
+        with self.lock:
+            self.inflight.discard(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def nack(self, path):
+        with self.lock:
+            self.inflight.discard(path)
+
+    def claim_backlog(self):
+        # sealed segments nobody is uploading, oldest first
+        with self.lock:
+            paths = sorted(
+                os.path.join(self.path, name) for name in os.listdir(self.path)
+                if name.endswith(self.SEALED)
+            )
+            paths = [path for path in paths if path not in self.inflight]
+            self.inflight.update(paths)
+        return paths
+
+    def backlog_size(self):
+        return sum(1 for name in os.listdir(self.path) if name.endswith(self.SEALED))
+
+
+_spools = {}
+_spools_lock = Lock()
+
+
+def get_spool(path, fsync_interval=1.0):
+    path = os.path.abspath(path)
+    with _spools_lock:
+        spool = _spools.get(path)
+        if spool is None:
+            spool = _spools[path] = Spool(path, fsync_interval=fsync_interval)
+        return spool
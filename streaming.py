@@ -1,150 +1,42 @@
+import argparse
 import tweepy
 import os
-import re
-import time
-from threading import Timer
-import requests
-import csv
-import json
 
-from io import StringIO
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from email.utils import parsedate_to_datetime
+import config
+import listener
+import metrics
+import terms
+import tinybird
+import tweetjson
 
 
 TWITTER_HANDLE = 'alrocar'
 
-CONSUMER_KEY = os.environ['CONSUMER_KEY']
-CONSUMER_SECRET = os.environ['CONSUMER_SECRET']
-ACCESS_TOKEN = os.environ['ACCESS_TOKEN']
-ACCESS_TOKEN_SECRET = os.environ['ACCESS_TOKEN_SECRET']
-TB_TOKEN = os.environ['TB_TOKEN']
-READ_TOKEN = os.environ['READ_TOKEN']
-
 TB_API_URL = 'https://api.wadus.tinybird.co/v0'
+UPLOAD_CODEC = os.environ.get('TB_UPLOAD_CODEC')
+TRACK = terms.parse_terms(os.environ.get('STREAM_TRACK', 'Merry Christmas,christmas,Navidad,Happy New Year'))
 datasource = 'tweets'
+PARSE_SECONDS = metrics.histogram('stage_seconds', stage='parse')
 
-auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-api = tweepy.API(auth, timeout=300)
-
-
-def get_requests_session():
-    retry = Retry(total=5, backoff_factor=10)
-    adapter = HTTPAdapter(max_retries=retry)
-    _session = requests.Session()
-    _session.mount('http://', adapter)
-    _session.mount('https://', adapter)
-    return _session
-
-
-class TinybirdApiSink():
-    def __init__(self, token, datasource, endpoint=TB_API_URL):
-        super().__init__()
-        self.endpoint = endpoint
-        self.token = token
-        self.datasource = datasource
-        self.url = f'{self.endpoint}/datasources?mode=append&name={self.datasource}&format=ndjson'
-        retry = Retry(total=5, backoff_factor=0.2)
-        adapter = HTTPAdapter(max_retries=retry)
-        self._session = requests.Session()
-        self._session.mount('http://', adapter)
-        self._session.mount('https://', adapter)
-        self.reset()
-        self.wait = False
-
-    def reset(self):
-        self.chunk = StringIO()
-
-    def append(self, value):
-        try:
-            self.chunk.write(json.dumps(value) + '\n')
-        except Exception as e:
-            print(e)
 
-    def tell(self):
-        return self.chunk.tell()
-
-    def flush(self):
-        self.wait = True
-        data = self.chunk.getvalue()
-        # f = open("sample.ndjson", "w")
-        # f.write(data)
-        # f.close()
-        # import sys
-        # sys.exit(0)
-        self.reset()
-        headers = {
-            'Authorization': f'Bearer {self.token}',
-            # 'X-TB-Client': f'{__version__.__name__}-{__version__.__version__}',
-        }
-
-        ok = False
-        try:
-            response = self._session.post(self.url, headers=headers, files=dict(ndjson=data))
-            print('flush response')
-            print(response)
-            ok = response.status_code < 400
-            self.wait = False
-            return ok
-        except Exception as e:
-            self.wait = False
-            print(e)
-            return ok
-
-
-class MyStreamListener(tweepy.StreamListener):
-
-    def __init__(self, name, api, search_term, max_wait_seconds=10,
-                 max_wait_records=10000,
-                 max_wait_bytes=1024*1024*1):
-        self.name = name
-        self.records = 0
-        self.api = api
-        self.search_term = search_term
-        self.sink = TinybirdApiSink(TB_TOKEN, datasource)
-        self.max_wait_seconds = max_wait_seconds
-        self.max_wait_records = max_wait_records
-        self.max_wait_bytes = max_wait_bytes
-        self.records = 0
-        self.timer = None
-        self.timer_start = None
-        self.tr_timer = None
-        self.tr_timer_start = None
-
-    def append(self, record):
-        if self.records % 100 == 0:
-            print('append')
-        self.sink.append(record)
-        self.records += 1
-        if self.records < self.max_wait_records and self.sink.tell() < self.max_wait_bytes:
-            if not self.timer:
-                self.timer_start = time.monotonic()
-                self.timer = Timer(self.max_wait_seconds, self.flush)
-                self.timer.name = f"f{self.name}_timer"
-                self.timer.start()
-        else:
-            self.flush()
-
-    def flush(self):
-        print('flush')
-        if self.timer:
-            self.timer.cancel()
-            self.timer = None
-            self.timer_start = None
-        if not self.records:
-            return
-        self.sink.flush()
-        self.records = 0
+class MyStreamListener(listener.StreamListener):
+    datasource = datasource
+
+    def new_sink(self, name):
+        return tinybird.TinybirdNdjsonSink(config.secret('TB_TOKEN'), name, endpoint=TB_API_URL, codec=UPLOAD_CODEC,
+                                           spool=listener.SPOOL_DIR, on_upload=self.flusher.observe)
+
+    def term(self, record):
+        return record['search_term']
 
     def on_data(self, raw_data):
-        while self.sink.wait:
-            print('wait flush')
-            time.sleep(1)
-        super().on_data(raw_data)
-        tweet = json.loads(raw_data)
-        if 'created_at' not in tweet or 'id' not in tweet or 'text' not in tweet:
+        if self.duplicate(raw_data):
+            return
+        start = metrics.clock()
+        tweet = tweetjson.decode(raw_data)
+        if tweet is None:
+            # control messages (limit, delete, warning...) go through tweepy
+            super().on_data(raw_data)
             return
         date = str(tweet['created_at'])
 
@@ -176,27 +68,42 @@ class MyStreamListener(tweepy.StreamListener):
         except Exception as e:
             print(e)
                 
-        tw = {
-            "search_term": self.search_term,
-            "tweet": text,
-            "date": parsedate_to_datetime(date).strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.append(tw)
+        date = tweetjson.format_date(date)
+        PARSE_SECONDS.since(start)
+        for search_term in self.tagger.tag(text):
+            tw = {
+                "search_term": search_term,
+                "tweet": text,
+                "date": date
+            }
+            self.append(tw)
         
 
 
 def connect():
+    myStreamListener = None
     try:
-        # myStreamListener = MyStreamListener('tweets', api, 'covid')
-        myStreamListener = MyStreamListener('tweets', api, 'Merry Christmas')
+        api = config.twitter_api()
+        # STREAM_TRACK=covid,coronavirus,omicron,vaccine,covid-19
+        myStreamListener = MyStreamListener('tweets', api, TRACK, route=listener.ROUTE,
+                                            target_throughput=listener.TARGET_THROUGHPUT)
         myStream = tweepy.Stream(auth=api.auth, listener=myStreamListener)
 
-        # myStream.filter(track=['covid', 'coronavirus', 'omicron', 'vaccine', 'covid-19'])
-        myStream.filter(track=['Merry Christmas', 'christmas', 'Navidad', 'Happy New Year'])
+        myStream.filter(track=myStreamListener.track)
     except Exception as e:
         print(e)
+    finally:
+        if myStreamListener:
+            myStreamListener.close()
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description='Append the tracked terms stream to Tinybird').parse_args(argv)
+    metrics.start()
+    while True:
+        print('connect')
+        connect()
 
 
-while True:
-    print('connect')
-    connect()
+if __name__ == '__main__':
+    main()
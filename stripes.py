@@ -0,0 +1,142 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+
+# red (negative) to green (positive)
+HUES = [[103,0,13], [165,15,21], [203,24,29], [239,59,44], [251,106,74], [252,146,114], [252,187,161], [254,224,210], [255,245,240], [247,252,245],[229,245,224],[199,233,192],[161,217,155],[116,196,118],[65,171,93],[35,139,69],[0,109,44],[0,68,27]]
+
+
+class StripesRenderer():
+    # stripe.png is decoded once. Every pixel matching its top-left colour is
+    # recoloured with each palette entry up front, so rendering is one
+    # palette-index computation plus a single gather into the banner.
+    def __init__(self, template='stripe.png', size=(1500, 500), hues=HUES):
+        self.size = size
+        self.hues = np.array(hues, dtype=np.uint8)
+        data = np.array(Image.open(template).convert('RGBA'))
+        self.height, self.width = data.shape[:2]
+        mask = (data[..., :3] == data[0, 0, :3]).all(axis=-1)
+        variants = np.repeat(data[np.newaxis, ..., :3], len(hues), axis=0)
+        variants[:, mask] = self.hues[:, np.newaxis, :]
+        self.variants = variants
+        self.banner = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+    def palette_index(self, polarities):
+        polarities = np.asarray(polarities, dtype='float64')
+        n = len(self.hues)
+        return np.mod(np.floor((polarities + 100) / (200 / n)), n).astype(np.intp)
+
+    def capacity(self):
+        # stripes past the right edge are clipped, as Image.paste does
+        return -(-self.size[0] // self.width)
+
+    def paint(self, banner, index, start=0):
+        # (count, h, w, 3) -> (h, count * w, 3): stripe i lands at x = i * w
+        if not len(index):
+            return
+        strip = self.variants[index].transpose(1, 0, 2, 3).reshape(self.height, len(index) * self.width, 3)
+        x = start * self.width
+        height = min(self.height, self.size[1])
+        width = min(strip.shape[1], self.size[0] - x)
+        banner[:height, x:x + width] = strip[:height, :width]
+
+    def render(self, data):
+        polarities = [p['polarity'] for p in data or []]
+        banner = self.banner
+        banner[:] = 0
+        count = min(len(polarities), self.capacity())
+        if count:
+            self.paint(banner, self.palette_index(polarities[:count]))
+        return banner
+
+    def save(self, data, path='stripes.png'):
+        Image.fromarray(self.render(data), 'RGB').save(path)
+
+
+class IncrementalStripes():
+    # Keeps the last rendered banner, the moving-average rows it was drawn
+    # from and their palette indices in state_path. When the new rows are
+    # the old window slid forward (old[k:] is a prefix of the new rows) the
+    # banner is shifted k stripes to the left and only the stripes after
+    # the overlap are painted; any other change falls back to a full render.
+    # update() returns whether the visible palette indices changed.
+    def __init__(self, renderer, state_path='stripes_state.npz'):
+        self.renderer = renderer
+        self.state_path = state_path
+        self.window = None
+        self.index = None
+        self.banner = None
+        self.mode = None
+        self.load()
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with np.load(self.state_path) as state:
+                banner = state['banner']
+                index = state['index']
+                window = json.loads(str(state['window']))
+        except Exception as e:
+            print(e)
+            return
+        if banner.shape != self.renderer.banner.shape:
+            return
+        self.banner, self.index, self.window = banner, index, window
+
+    def save(self):
+        tmp = f'{self.state_path}.tmp.npz'
+        np.savez(tmp, banner=self.banner, index=self.index, window=np.array(json.dumps(self.window)))
+        os.replace(tmp, self.state_path)
+
+    def overlap(self, rows):
+        old = self.window
+        for k in range(len(old)):
+            if old[k] == rows[0] and old[k:] == rows[:len(old) - k]:
+                return k
+
+    def update(self, data):
+        rows = list(data or [])
+        renderer = self.renderer
+        capacity = renderer.capacity()
+        if self.banner is not None and rows == self.window:
+            self.mode = 'unchanged'
+            return False
+
+        index = renderer.palette_index([p['polarity'] for p in rows[:capacity]])
+        k = self.overlap(rows) if self.window and rows else None
+        # stripes [0, kept) are already on the banner, k stripes further right
+        kept = min(len(self.window), capacity) - k if k is not None else 0
+        if kept <= 0:
+            self.banner = renderer.render(rows).copy()
+            self.mode = 'full'
+        else:
+            banner = self.banner
+            if k:
+                shift = k * renderer.width
+                banner[:, :-shift] = banner[:, shift:]
+            banner[:, kept * renderer.width:] = 0
+            renderer.paint(banner, index[kept:], start=kept)
+            self.mode = 'incremental'
+
+        changed = self.index is None or not np.array_equal(index, self.index)
+        self.window = rows
+        self.index = index
+        if self.state_path:
+            self.save()
+        return changed
+
+    def save_png(self, path='stripes.png'):
+        Image.fromarray(self.banner, 'RGB').save(path)
+
+
+_renderers = {}
+
+
+def get_renderer(template='stripe.png'):
+    if template not in _renderers:
+        _renderers[template] = StripesRenderer(template)
+    return _renderers[template]
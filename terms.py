@@ -0,0 +1,69 @@
+import re
+
+
+WORD = re.compile(r'\w+')
+SLUG = re.compile(r'[^0-9a-z]+')
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+class TermTagger():
+    # Tags a text with the tracked terms it matches, the way the filter
+    # stream matches track phrases: every word of the phrase has to be in
+    # the text, in any order, ignoring case ("covid-19" needs "covid" and
+    # "19", "#covid" counts as "covid").
+    #
+    # Each term is indexed under a single anchor, the word of the phrase
+    # that the fewest other terms use, so a tweet costs one tokenization plus
+    # a dict lookup per distinct word and a subset check per candidate term,
+    # however many terms are tracked. Tweets that match no term (the stream
+    # also matches urls and user names) get the only term when a single one
+    # is tracked, '' otherwise.
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(terms))
+        if not self.terms:
+            raise ValueError('at least one term is needed')
+        term_words = [frozenset(words(term)) for term in self.terms]
+        shared = {}
+        for ws in term_words:
+            for word in ws:
+                shared[word] = shared.get(word, 0) + 1
+        self.index = {}
+        for i, ws in enumerate(term_words):
+            if ws:
+                anchor = min(ws, key=lambda word: (shared[word], -len(word), word))
+                self.index.setdefault(anchor, []).append((i, ws))
+        self.default = self.terms[0] if len(self.terms) == 1 else ''
+
+    def match(self, text):
+        index = self.index
+        text_words = set(words(text))
+        matched = [i for word in text_words for i, ws in index.get(word, ()) if ws <= text_words]
+        return [self.terms[i] for i in sorted(matched)]
+
+    def tag(self, text):
+        return self.match(text) or [self.default]
+
+
+_taggers = {}
+
+
+def get_tagger(terms):
+    # one tagger per process and term list, for the scoring workers
+    terms = tuple(terms)
+    if terms not in _taggers:
+        _taggers[terms] = TermTagger(terms)
+    return _taggers[terms]
+
+
+def datasource_name(datasource, term):
+    # tweets + "Merry Christmas" -> tweets_merry_christmas
+    slug = SLUG.sub('_', term.lower()).strip('_')
+    return f'{datasource}_{slug}' if slug else datasource
+
+
+def parse_terms(value):
+    # comma separated, as in STREAM_TRACK="covid,omicron,covid-19"
+    return [term.strip() for term in value.split(',') if term.strip()]
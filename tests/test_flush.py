@@ -0,0 +1,126 @@
+import flush
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def controller(**kwargs):
+    clock = Clock()
+    flushed = []
+    kwargs.setdefault('smoothing', 1.0)
+    c = flush.FlushController(lambda: flushed.append(clock()), start=False, clock=clock, **kwargs)
+    return c, clock, flushed
+
+
+def warm_up(c, clock, records=100):
+    # one flush after a second of `records` rows sets the rate estimate
+    c.add(records)
+    clock.now = 1.0
+    assert c.poll(force=True)['reason'] == 'close'
+
+
+def test_max_records_flushes_immediately():
+    c, clock, flushed = controller(max_records=10)
+    c.add(9)
+    assert c.poll() is None
+    c.add(1)
+    assert c.poll()['reason'] == 'max_records'
+    assert flushed == [0.0]
+    assert c.pending == 0
+
+
+def test_max_bytes_flushes_immediately():
+    c, clock, flushed = controller(max_bytes=1000)
+    c.add(1, size=1000)
+    assert c.poll()['reason'] == 'max_bytes'
+    assert len(flushed) == 1
+
+
+def test_window_flush():
+    c, clock, flushed = controller(target_latency=10)
+    c.add(1)
+    clock.now = 5.0
+    assert c.poll() is None
+    clock.now = 10.0
+    decision = c.poll()
+    assert decision['reason'] == 'window'
+    assert decision['waited'] == 10.0
+
+
+def test_window_shrinks_as_latency_rises():
+    c, clock, flushed = controller(target_latency=10)
+    assert c.window == 10
+    c.observe(2)
+    assert c.window == 8
+    c.observe(4)
+    assert c.window == 6
+
+
+def test_batch_follows_rate():
+    c, clock, flushed = controller(target_latency=10)
+    warm_up(c, clock, 100)
+    assert c.rate == 100
+    assert c.batch == 1000
+    c.observe(4)
+    assert c.batch == 600
+    # twice the rows in the next second doubles the batch
+    c.add(200)
+    clock.now = 2.0
+    c.poll(force=True)
+    assert c.rate == 200
+    assert c.batch == 1200
+
+
+def test_target_throughput_sizing():
+    c, clock, flushed = controller(target_latency=10, target_throughput=500, in_flight=2)
+    warm_up(c, clock, 100)
+    c.observe(2)
+    # two uploads of 2s in flight carry 500 rows/s with 500 rows each
+    assert c.batch == 500
+    # and 100 rows/s take 5s to fill one
+    assert c.window == 5
+
+
+def test_interval_floor():
+    c, clock, flushed = controller(target_latency=10, in_flight=2, headroom=1.5)
+    c.observe(9)
+    assert c.interval() == 6.75
+    assert c.window == 6.75
+
+
+def test_full_batch_waits_for_interval():
+    c, clock, flushed = controller(target_latency=10, in_flight=2, headroom=1.5)
+    warm_up(c, clock, 100)
+    c.observe(4)
+    assert (c.window, c.batch, c.interval()) == (6, 600, 3)
+    clock.now = 1.5
+    c.add(600)
+    clock.now = 2.0
+    assert c.poll() is None
+    assert c.deadline() == 4.0
+    clock.now = 4.0
+    assert c.poll()['reason'] == 'batch'
+
+
+def test_close_flushes_what_is_left():
+    c, clock, flushed = controller()
+    c.add(3)
+    c.close()
+    assert flushed == [0.0]
+    assert c.last()['reason'] == 'close'
+    assert c.last()['records'] == 3
+    assert c.pending == 0
+
+
+def test_close_with_thread():
+    flushed = []
+    c = flush.FlushController(lambda: flushed.append(1), target_latency=60)
+    c.add(2)
+    c.close()
+    assert flushed == [1]
+    assert not c.thread.is_alive()
@@ -0,0 +1,198 @@
+import json
+
+import pytest
+import requests
+
+from fake_timeline import FakeClock, FakeTimeline
+from timeline import RateLimited, TimelineFetcher, tweepy_source
+
+
+def fetcher(fetch, clock, **kwargs):
+    kwargs.setdefault('prefetch', 0)
+    return TimelineFetcher(fetch, clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+def without_headers(timeline):
+    def fetch(**kwargs):
+        return timeline(**kwargs)[0], {}
+    return fetch
+
+
+def test_pace_without_headers():
+    clock = FakeClock()
+    f = fetcher(None, clock, default_interval=65)
+    assert f.pace() == 65
+    f.update_limits({})
+    assert f.pace() == 65
+
+
+def test_pace_with_headers():
+    clock = FakeClock()
+    f = fetcher(None, clock)
+    f.update_limits({'x-rate-limit-remaining': '3', 'x-rate-limit-reset': str(clock.time() + 600)})
+    assert f.pace() == 0
+    f.update_limits({'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(clock.time() + 600)})
+    assert f.pace() == 601
+    # a reset already in the past only waits the extra second
+    f.update_limits({'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(clock.time() - 10)})
+    assert f.pace() == 1
+
+
+def test_no_wait_while_budget_left():
+    clock = FakeClock()
+    timeline = FakeTimeline(limit=15, clock=clock)
+    f = fetcher(timeline, clock, pages=5)
+    assert len(list(f.iter_pages())) == 5
+    assert f.waits == 0
+    assert clock.time() == 1_600_000_000.0
+
+
+def test_waits_for_reset_when_budget_spent():
+    clock = FakeClock()
+    timeline = FakeTimeline(limit=2, window=900, clock=clock)
+    f = fetcher(timeline, clock, pages=4)
+    assert len(list(f.iter_pages())) == 4
+    # paced from the headers, so the fake never answered 429
+    assert f.requests == timeline.calls == 4
+    assert f.waits == 1
+    assert f.waited == 901
+
+
+def test_rate_limited_waits_for_reset_and_retries():
+    clock = FakeClock()
+    timeline = FakeTimeline(limit=2, window=900, clock=clock)
+    f = fetcher(without_headers(timeline), clock, pages=3, default_interval=0)
+    pages = list(f.iter_pages())
+    assert len(pages) == 3
+    assert [status.id for status in pages[2]][0] == pages[1][-1].id - 1
+    # the third request got a 429 and was retried after the reset
+    assert f.requests == 4
+    assert timeline.calls == 3
+    assert f.waits == 1
+    assert clock.time() == 1_600_000_000.0 + 901
+
+
+def test_max_wait_budget_between_pages():
+    clock = FakeClock()
+    timeline = FakeTimeline(limit=2, window=900, clock=clock)
+    f = fetcher(timeline, clock, pages=4, max_wait=100)
+    assert len(list(f.iter_pages())) == 2
+    assert f.waits == 0
+    assert clock.time() == 1_600_000_000.0
+
+
+def test_max_wait_budget_on_rate_limit():
+    clock = FakeClock()
+    timeline = FakeTimeline(limit=2, window=900, clock=clock)
+    f = fetcher(without_headers(timeline), clock, pages=4, default_interval=0, max_wait=100)
+    assert len(list(f.iter_pages())) == 2
+    assert f.requests == 3
+    assert f.waits == 0
+
+
+def test_max_id_paging_with_since_id():
+    clock = FakeClock()
+    timeline = FakeTimeline(size=1000, clock=clock)
+    calls = []
+
+    def fetch(**kwargs):
+        calls.append(kwargs)
+        return timeline(**kwargs)
+
+    f = fetcher(fetch, clock, since_id=10_500, count=200)
+    pages = list(f.iter_pages())
+    assert [len(page) for page in pages] == [200, 200, 99]
+    ids = [status.id for page in pages for status in page]
+    assert ids == list(range(10_999, 10_500, -1))
+    assert calls[0] == {'count': 200, 'since_id': 10_500}
+    assert calls[1] == {'count': 200, 'since_id': 10_500, 'max_id': 10_799}
+    assert calls[2] == {'count': 200, 'since_id': 10_500, 'max_id': 10_599}
+    # the empty page after the last one ends the run
+    assert len(calls) == 4
+
+
+def test_prefetch_yields_the_same_pages():
+    clock = FakeClock()
+    f = fetcher(FakeTimeline(size=1000, clock=clock), clock, count=300, prefetch=2)
+    pages = list(f.pages())
+    assert [len(page) for page in pages] == [300, 300, 300, 100]
+
+
+def test_prefetch_reraises_fetch_errors():
+    clock = FakeClock()
+    timeline = FakeTimeline(clock=clock)
+    calls = []
+
+    def fetch(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ValueError('connection reset')
+        return timeline(**kwargs)
+
+    pages = fetcher(fetch, clock, prefetch=1).pages()
+    assert len(next(pages)) == 200
+    with pytest.raises(ValueError, match='connection reset'):
+        next(pages)
+
+
+def stub_twitter(monkeypatch, timeline):
+    # answers tweepy's requests from the fake timeline, with its headers
+    calls = []
+
+    def request(session, method, url, **kwargs):
+        params = {key: int(value) for key, value in session.params.items() if key in ('count', 'since_id', 'max_id')}
+        calls.append((url, params))
+        response = requests.Response()
+        response.url = url
+        try:
+            page, headers = timeline(**params)
+        except RateLimited as e:
+            response.status_code = 429
+            response.headers.update(e.headers)
+            response._content = json.dumps({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}).encode()
+            return response
+        response.status_code = 200
+        response.headers.update(headers)
+        response._content = json.dumps([{'id': status.id, 'text': status.text,
+                                         'created_at': 'Fri Dec 24 10:00:00 +0000 2021'} for status in page]).encode()
+        return response
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    return calls
+
+
+def tweepy_api():
+    tweepy = pytest.importorskip('tweepy')
+    auth = tweepy.OAuthHandler('key', 'secret')
+    auth.set_access_token('token', 'token secret')
+    return tweepy.API(auth)
+
+
+def test_tweepy_source_pages_a_real_api(monkeypatch):
+    clock = FakeClock()
+    calls = stub_twitter(monkeypatch, FakeTimeline(size=500, limit=15, clock=clock))
+    f = fetcher(tweepy_source(tweepy_api(), 'home_timeline'), clock, since_id=10_100, count=200)
+    pages = list(f.iter_pages())
+    assert [len(page) for page in pages] == [200, 199]
+    assert pages[0][0].id == 10_499
+    assert calls[1][0].endswith('/statuses/home_timeline.json')
+    assert calls[1][1] == {'count': 200, 'since_id': 10_100, 'max_id': 10_299}
+    # the empty page after the last one ends the run
+    assert len(calls) == 3
+    assert f.remaining == 12
+
+
+def test_tweepy_source_rate_limited(monkeypatch):
+    clock = FakeClock()
+    timeline = FakeTimeline(size=500, limit=1, window=900, clock=clock)
+    stub_twitter(monkeypatch, timeline)
+    f = fetcher(tweepy_source(tweepy_api(), 'home_timeline'), clock, pages=2, default_interval=0)
+    # the headers say the budget is spent, so the second page waits for the reset
+    assert [len(page) for page in f.iter_pages()] == [200, 200]
+    assert f.waited == 901
+    # a 429 the headers did not announce is waited out and retried as well
+    f.remaining = None
+    timeline.used = timeline.limit
+    assert len(f.fetch_page(None)) == 200
+    assert f.requests == 4
+    assert f.waits == 2
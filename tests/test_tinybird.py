@@ -0,0 +1,20 @@
+from tinybird_server import TinybirdStandIn
+
+import tinybird
+
+
+def test_flusher_survives_a_failing_upload():
+    def on_upload(seconds):
+        raise OSError('No space left on device')
+
+    with TinybirdStandIn() as server:
+        sink = tinybird.TinybirdApiSink('token', 'tweets', endpoint=server.url, max_in_flight=1, on_upload=on_upload)
+        # more flushes than max_in_flight: each one waits for the previous
+        for i in range(3):
+            sink.append([i, '2021-12-24 10:00:00', 'merry christmas', 0.5])
+            sink.flush()
+        sink.close()
+        assert server.requests == 3
+    assert sink.flushes == 3
+    assert sink.failed_flushes == 3
+    assert not sink.flusher.is_alive()
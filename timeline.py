@@ -0,0 +1,137 @@
+import queue
+import time
+from threading import Thread
+
+
+_DONE = object()
+
+
+def tweepy_source(api, method='home_timeline'):
+    # Adapts a tweepy API method (e.g. 'home_timeline') to the
+    # fetch(**kwargs) -> (statuses, headers) interface of TimelineFetcher.
+    # tweepy 3 builds API methods as plain functions, so the API is passed
+    # in to read the response headers from its last_response.
+    method = getattr(api, method)
+
+    def fetch(**kwargs):
+        try:
+            statuses = method(**kwargs)
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            if response is not None and response.status_code == 429:
+                raise RateLimited(response.headers)
+            raise
+        response = getattr(api, 'last_response', None)
+        return statuses, response.headers if response is not None else {}
+    return fetch
+
+
+class RateLimited(Exception):
+    def __init__(self, headers):
+        super().__init__('rate limited')
+        self.headers = headers
+
+
+class TimelineFetcher():
+    # Pages through a timeline newest to oldest (max_id = oldest id - 1, like
+    # tweepy.Cursor) and paces requests from the x-rate-limit-remaining and
+    # x-rate-limit-reset headers: it only waits once the window's budget is
+    # spent, instead of sleeping after every page. Without rate-limit headers
+    # it falls back to default_interval seconds between pages.
+    #
+    # pages() yields each page as soon as it arrives while a background
+    # thread already fetches the next `prefetch` pages, so the caller can
+    # score and upload page N while page N + 1 is in flight.
+    def __init__(self, fetch, since_id=None, pages=20, count=200, prefetch=1,
+                 default_interval=65, max_wait=None, clock=time.time, sleep=time.sleep):
+        self.fetch = fetch
+        self.since_id = since_id
+        self.max_pages = pages
+        self.count = count
+        self.prefetch = prefetch
+        self.default_interval = default_interval
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.requests = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.remaining = None
+        self.reset = None
+
+    def update_limits(self, headers):
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        self.remaining = int(remaining) if remaining is not None else None
+        self.reset = float(reset) if reset is not None else None
+
+    def pace(self):
+        # how long to wait before the next request
+        if self.remaining is None or self.reset is None:
+            return self.default_interval
+        if self.remaining > 0:
+            return 0
+        return max(0.0, self.reset - self.clock()) + 1
+
+    def wait(self, seconds):
+        if self.max_wait is not None and self.waited + seconds > self.max_wait:
+            return False
+        if seconds > 0:
+            self.waits += 1
+            self.waited += seconds
+            self.sleep(seconds)
+        return True
+
+    def fetch_page(self, max_id):
+        kwargs = {'count': self.count}
+        if self.since_id:
+            kwargs['since_id'] = self.since_id
+        if max_id:
+            kwargs['max_id'] = max_id
+        while True:
+            self.requests += 1
+            try:
+                statuses, headers = self.fetch(**kwargs)
+            except RateLimited as e:
+                self.update_limits(e.headers)
+                self.remaining = 0
+                if not self.wait(self.pace()):
+                    return None
+                continue
+            self.update_limits(headers)
+            return statuses
+
+    def iter_pages(self):
+        max_id = None
+        for n in range(self.max_pages):
+            if n and not self.wait(self.pace()):
+                print('timeline wait budget exhausted')
+                return
+            page = self.fetch_page(max_id)
+            if not page:
+                return
+            yield page
+            max_id = min(status.id for status in page) - 1
+
+    def pages(self):
+        if not self.prefetch:
+            yield from self.iter_pages()
+            return
+        pages = queue.Queue(maxsize=self.prefetch)
+
+        def produce():
+            try:
+                for page in self.iter_pages():
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            pages.put(_DONE)
+
+        Thread(target=produce, name='timeline_fetcher', daemon=True).start()
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
@@ -0,0 +1,543 @@
+import csv
+import json
+import os
+import queue
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import BoundedSemaphore, Lock, Thread
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import tweetjson
+from spool import get_spool
+
+
+TB_API_URL = 'https://api.tinybird.co/v0'
+
+
+class GzipCodec():
+    extension = 'gz'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+
+# Any object with an ``extension`` and a ``compressor()`` returning something
+# with compress(bytes) and flush() (the zlib/bz2/lzma interface) can be
+# registered as a codec.
+CODECS = {
+    'gzip': GzipCodec,
+}
+
+
+def register_codec(name, codec):
+    CODECS[name] = codec
+
+
+def get_codec(codec):
+    if codec is None or codec == '':
+        return
+    if isinstance(codec, str):
+        return CODECS[codec]()
+    return codec
+
+
+class Buffer():
+    # File-like target for csv.writer and the NDJSON encoder. Rows are
+    # compressed as they are written, so flushing only has to finish the
+    # stream instead of compressing the whole batch in one go. With a spool
+    # segment the uncompressed bytes are written through to disk as well.
+    def __init__(self, codec=None, segment=None):
+        self.codec = codec
+        self.compressor = codec.compressor() if codec else None
+        self.segment = segment
+        self.out = BytesIO()
+        self.raw_bytes = 0
+
+    def write(self, value):
+        data = value if isinstance(value, bytes) else value.encode('utf-8')
+        self.raw_bytes += len(data)
+        if self.segment:
+            self.segment.write(data)
+        if self.compressor:
+            data = self.compressor.compress(data)
+        return self.out.write(data)
+
+    def tell(self):
+        return self.raw_bytes
+
+    def getvalue(self):
+        if self.compressor:
+            self.out.write(self.compressor.flush())
+            self.compressor = None
+        return self.out.getvalue()
+
+
+def compress(data, codec=None):
+    if not codec:
+        return data
+    compressor = codec.compressor()
+    return compressor.compress(data) + compressor.flush()
+
+
+class TinybirdClient():
+    # One pooled keep-alive session per API endpoint, shared by pipe reads
+    # and to_tinybird. The latency of the last 10000 requests is kept in
+    # `latencies` as (name, seconds) so runs can be compared.
+    # Requests made with retry=False go through a second pool without
+    # urllib3 retries, for callers that retry on their own (BulkUploader).
+    def __init__(self, endpoint=TB_API_URL, pool_size=10, retry=None):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.session = self.new_session(retry or Retry(total=5, backoff_factor=10))
+        self.session_no_retry = self.new_session(Retry(total=0, read=False))
+        self.latencies = deque(maxlen=10000)
+
+    def new_session(self, retry):
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def request(self, method, url, name=None, retry=True, **kwargs):
+        session = self.session if retry else self.session_no_retry
+        start = time.perf_counter()
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            self.latencies.append((name or url.split('?')[0], time.perf_counter() - start))
+
+    def get(self, url, name=None, retry=True, **kwargs):
+        return self.request('GET', url, name=name, retry=retry, **kwargs)
+
+    def post(self, url, name=None, retry=True, **kwargs):
+        return self.request('POST', url, name=name, retry=retry, **kwargs)
+
+    def query_pipe(self, pipe, token):
+        url = f'{self.endpoint}/pipes/{pipe}.json?token={token}'
+        response = self.get(url, name=pipe)
+        return response.json()['data']
+
+    def query_pipes(self, pipes, token, concurrency=None):
+        # independent pipe reads, issued at the same time
+        with ThreadPoolExecutor(max_workers=concurrency or min(len(pipes), self.pool_size)) as executor:
+            results = executor.map(lambda pipe: self.query_pipe(pipe, token), pipes)
+            return dict(zip(pipes, results))
+
+    def latency_summary(self):
+        # {name: (requests, mean ms, max ms)}
+        by_name = {}
+        for name, seconds in self.latencies:
+            by_name.setdefault(name, []).append(seconds * 1000)
+        return {name: (len(ms), round(sum(ms) / len(ms), 1), round(max(ms), 1)) for name, ms in by_name.items()}
+
+
+_clients = {}
+
+
+def get_client(endpoint=TB_API_URL, pool_size=None):
+    client = _clients.get(endpoint)
+    if client is None or (pool_size and pool_size != client.pool_size):
+        client = _clients[endpoint] = TinybirdClient(endpoint, pool_size=pool_size or 10)
+    return client
+
+
+def upload_file(format, data, codec=None):
+    if codec:
+        return {format: (f'data.{format}.{codec.extension}', data)}
+    return {format: data}
+
+
+# raw (uncompressed) bytes per bulk upload request
+CHUNK_BYTES = int(os.environ.get('TB_CHUNK_BYTES', 8 * 1024 * 1024))
+
+
+class BulkUploader():
+    # Writes rows into chunks of about `chunk_bytes` raw bytes as they come,
+    # each with the column header, and posts them concurrently over the
+    # pooled client. Only `max_in_flight` chunks are filled, queued or
+    # posting at a time, so memory does not grow with the input. A chunk
+    # that fails with a connection error, 429 or 5xx is retried on its own
+    # with exponential backoff, and only here: its requests skip the
+    # client's urllib3 retries. After a failure new rows are dropped and
+    # close() raises once the posted chunks are done.
+    #
+    # upload(rows) takes any iterable; write(row) ... close() lets rows be
+    # pushed as they are produced, e.g. page by page.
+    #
+    # With mode=create/replace the first chunk is posted in that mode before
+    # the rest are appended.
+    def __init__(self, datasource_name, columns, token, mode='append', endpoint=TB_API_URL, codec=None,
+                 chunk_bytes=CHUNK_BYTES, max_in_flight=4, retries=3, backoff=0.5):
+        self.datasource_name = datasource_name
+        self.columns = columns
+        self.token = token
+        self.mode = mode
+        self.endpoint = endpoint
+        self.codec = get_codec(codec)
+        self.chunk_bytes = chunk_bytes
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.client = get_client(endpoint)
+        self.headers = {
+            'Authorization': f'Bearer {token}',
+            'X-TB-Client': 'alrocar-tweets-0.1',
+        }
+        self.lock = Lock()
+        self.chunks = 0
+        self.rows = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.retried = 0
+        self.errors = []
+        self.chunk = None
+        self.writer = None
+        self.count = 0
+        self.slots = BoundedSemaphore(max_in_flight)
+        self.executor = None
+        self.chunk_seconds = metrics.histogram('stage_seconds', stage='bulk_chunk', datasource=datasource_name)
+
+    def url(self, mode):
+        return f'{self.endpoint}/datasources?mode={mode}&name={self.datasource_name}'
+
+    def new_chunk(self):
+        chunk = Buffer(self.codec)
+        writer = csv.writer(chunk, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(self.columns)
+        return chunk, writer
+
+    def post(self, data, mode):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = self.client.post(self.url(mode), name=self.datasource_name, retry=False,
+                                            headers=self.headers, files=upload_file('csv', data, self.codec))
+            except Exception as e:
+                error = str(e)
+                continue
+            if response.status_code < 400:
+                return
+            try:
+                error = json.dumps(response.json())
+            except ValueError:
+                error = f'{response.status_code} {response.text}'
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        raise Exception(error)
+
+    def upload_chunk(self, chunk, count, mode):
+        raw_bytes = chunk.tell()
+        data = chunk.getvalue()
+        start = metrics.clock()
+        try:
+            self.post(data, mode)
+        except Exception as e:
+            print(f'{self.datasource_name}: chunk of {count} rows failed: {e}')
+            with self.lock:
+                self.errors.append(str(e))
+            return False
+        self.chunk_seconds.since(start)
+        print(f'{self.datasource_name}: {raw_bytes} raw bytes, {len(data)} wire bytes')
+        with self.lock:
+            self.rows += count
+            self.raw_bytes += raw_bytes
+            self.wire_bytes += len(data)
+        return True
+
+    def write(self, row):
+        if self.errors:
+            return
+        if self.chunk is None:
+            self.chunk, self.writer = self.new_chunk()
+        self.writer.writerow(row)
+        self.count += 1
+        if self.chunk.tell() >= self.chunk_bytes:
+            self.submit()
+
+    def submit(self):
+        chunk, count = self.chunk, self.count
+        self.chunk, self.writer, self.count = None, None, 0
+        self.chunks += 1
+        if self.mode != 'append':
+            # the chunk that creates or replaces the datasource has to land first
+            self.upload_chunk(chunk, count, self.mode)
+            self.mode = 'append'
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.slots.acquire()
+        future = self.executor.submit(self.upload_chunk, chunk, count, 'append')
+        future.add_done_callback(lambda f: self.slots.release())
+
+    def close(self):
+        # posts what is left and waits for every chunk; nothing is posted
+        # for an empty append, an empty create/replace still sends the header
+        if not self.errors and (self.chunk is not None or (not self.chunks and self.mode != 'append')):
+            if self.chunk is None:
+                self.chunk, self.writer = self.new_chunk()
+            self.submit()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.errors:
+            raise Exception(self.errors[0])
+        return self.rows
+
+    def upload(self, rows):
+        for row in rows:
+            if self.errors:
+                break
+            self.write(row)
+        return self.close()
+
+    def stats(self):
+        return {'chunks': self.chunks, 'rows': self.rows, 'raw_bytes': self.raw_bytes,
+                'wire_bytes': self.wire_bytes, 'retried': self.retried}
+
+
+def to_tinybird(rows, datasource_name, columns, token, mode='append', endpoint=TB_API_URL, codec=None, **kwargs):
+    # rows can be any iterable, including a generator; see BulkUploader
+    return BulkUploader(datasource_name, columns, token, mode=mode, endpoint=endpoint, codec=codec, **kwargs).upload(rows)
+
+
+class TinybirdApiSink():
+    # Rows are appended to the active buffer. flush() swaps in an empty one
+    # straight away and a background thread uploads the full buffer, so the
+    # ingest side only waits when max_in_flight buffers are already queued
+    # or uploading. With a spool directory every row is also written to a
+    # local segment that is only deleted once its upload succeeded; leftover
+    # segments are replayed in parallel on start and after an outage. The
+    # spool lives under <spool>/<host>/<format>/<datasource>, so sinks for
+    # different endpoints or formats never replay each other's rows, and
+    # close() waits for any replay still running.
+    format = 'csv'
+
+    def __init__(self, token, datasource, endpoint=TB_API_URL, max_in_flight=2, codec=None,
+                 spool=None, replay_workers=4, on_upload=None):
+        super().__init__()
+        self.endpoint = endpoint
+        self.token = token
+        self.datasource = datasource
+        self.codec = get_codec(codec)
+        self.url = f'{self.endpoint}/datasources?mode=append&name={self.datasource}'
+        if self.format != 'csv':
+            self.url += f'&format={self.format}'
+        retry = Retry(total=5, backoff_factor=0.2)
+        adapter = HTTPAdapter(max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self.lock = Lock()
+        if isinstance(spool, str):
+            spool = get_spool(os.path.join(spool, urlparse(endpoint).netloc, self.format, datasource))
+        self.spool = spool
+        self.replay_workers = replay_workers
+        self.replay_lock = Lock()
+        self.replays = []
+        self.replayed = 0
+        self.buffered = 0
+        self.reset()
+        self.max_in_flight = max_in_flight
+        self.slots = BoundedSemaphore(max_in_flight)
+        self.buffers = queue.Queue()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.last_flush = None
+        # seconds spent posting each of the last flushes, also passed to on_upload
+        self.flush_latencies = deque(maxlen=10000)
+        self.on_upload = on_upload
+        labels = {'datasource': datasource}
+        self.appended = metrics.counter('sink_records_total', **labels)
+        self.serialize_seconds = metrics.histogram('stage_seconds', stage='serialize', **labels)
+        self.flush_seconds = metrics.histogram('stage_seconds', stage='flush', **labels)
+        self.flush_ok = metrics.counter('sink_flushes_total', result='ok', **labels)
+        self.flush_failed = metrics.counter('sink_flushes_total', result='failed', **labels)
+        self.raw_bytes_total = metrics.counter('sink_raw_bytes_total', **labels)
+        self.wire_bytes_total = metrics.counter('sink_wire_bytes_total', **labels)
+        metrics.gauge('sink_buffer_bytes', self.tell, **labels)
+        metrics.gauge('sink_buffer_records', lambda: self.buffered, **labels)
+        metrics.gauge('sink_in_flight', self.in_flight, **labels)
+        if self.spool:
+            metrics.gauge('sink_spool_segments', self.spool.backlog_size, **labels)
+        self.flusher = Thread(target=self._flush_loop, name=f'{datasource}_flusher', daemon=True)
+        self.flusher.start()
+        if self.spool:
+            self.replay_async()
+
+    def new_buffer(self):
+        segment = self.spool.open_segment() if self.spool else None
+        return Buffer(self.codec, segment)
+
+    def reset(self):
+        self.chunk = self.new_buffer()
+        self.writer = csv.writer(self.chunk, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+
+    def encode(self, value):
+        self.writer.writerow(value)
+
+    def append(self, value):
+        try:
+            with self.lock:
+                start = metrics.clock()
+                self.encode(value)
+                self.serialize_seconds.since(start)
+                self.buffered += 1
+            self.appended.inc()
+        except Exception as e:
+            print(e)
+
+    def tell(self):
+        return self.chunk.tell()
+
+    def flush(self):
+        # blocks only while max_in_flight buffers are pending
+        self.slots.acquire()
+        with self.lock:
+            chunk = self.chunk
+            self.reset()
+            self.buffered = 0
+        if not chunk.tell():
+            if chunk.segment:
+                chunk.segment.seal()
+            self.slots.release()
+            return
+        self.buffers.put(chunk)
+
+    def upload(self, chunk):
+        path = self.spool.seal(chunk.segment) if chunk.segment else None
+        data = chunk.getvalue()
+        self.last_flush = {'raw_bytes': chunk.tell(), 'wire_bytes': len(data)}
+        self.raw_bytes += chunk.tell()
+        self.wire_bytes += len(data)
+        print(f'flush {self.datasource}: {chunk.tell()} raw bytes, {len(data)} wire bytes')
+        start = time.perf_counter()
+        ok = self.post(data)
+        self.flush_latencies.append(time.perf_counter() - start)
+        if self.on_upload:
+            self.on_upload(self.flush_latencies[-1])
+        if metrics.enabled:
+            self.flush_seconds.observe(self.flush_latencies[-1])
+            (self.flush_ok if ok else self.flush_failed).inc()
+            self.raw_bytes_total.inc(chunk.tell())
+            self.wire_bytes_total.inc(len(data))
+        if path:
+            if ok:
+                self.spool.ack(path)
+                # the endpoint is reachable again, catch up on the backlog
+                if self.spool.backlog_size():
+                    self.replay_async()
+            else:
+                self.spool.nack(path)
+        return ok
+
+    def post(self, data):
+        headers = {
+            'Authorization': f'Bearer {self.token}',
+            # 'X-TB-Client': f'{__version__.__name__}-{__version__.__version__}',
+        }
+
+        ok = False
+        try:
+            response = self._session.post(self.url, headers=headers, files=upload_file(self.format, data, self.codec))
+            print(f'flush response {self.datasource}: {response.status_code}')
+            ok = response.status_code < 400
+        except Exception as e:
+            print(e)
+        return ok
+
+    def _flush_loop(self):
+        while True:
+            chunk = self.buffers.get()
+            if chunk is None:
+                self.buffers.task_done()
+                break
+            # a buffer that fails in any way (e.g. the spool's disk is full)
+            # only counts as a failed flush; this thread must keep going
+            ok = False
+            try:
+                ok = self.upload(chunk)
+            except Exception as e:
+                print(f'flush {self.datasource} failed: {e}')
+            finally:
+                self.flushes += 1
+                if not ok:
+                    self.failed_flushes += 1
+                self.buffers.task_done()
+                self.slots.release()
+
+    def replay_segment(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        ok = self.post(compress(data, self.codec))
+        if ok:
+            self.spool.ack(path)
+        else:
+            self.spool.nack(path)
+        return ok
+
+    def replay(self):
+        # segments already hold encoded rows, so they are posted as they are
+        if not self.replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            paths = self.spool.claim_backlog()
+            if not paths:
+                return 0
+            print(f'replay {self.datasource}: {len(paths)} segments')
+            with ThreadPoolExecutor(max_workers=self.replay_workers) as executor:
+                replayed = sum(executor.map(self.replay_segment, paths))
+            self.replayed += replayed
+            return replayed
+        finally:
+            self.replay_lock.release()
+
+    def replay_async(self):
+        self.replays = [thread for thread in self.replays if thread.is_alive()]
+        thread = Thread(target=self.replay, name=f'{self.datasource}_replay', daemon=True)
+        self.replays.append(thread)
+        thread.start()
+
+    def in_flight(self):
+        return self.buffers.unfinished_tasks
+
+    def join(self):
+        # waits until every flushed buffer has been uploaded
+        self.buffers.join()
+
+    def close(self):
+        self.flush()
+        self.join()
+        self.buffers.put(None)
+        self.flusher.join()
+        for thread in self.replays:
+            thread.join()
+        if self.chunk.segment:
+            self.chunk.segment.seal()
+
+
+class TinybirdNdjsonSink(TinybirdApiSink):
+    format = 'ndjson'
+
+    def reset(self):
+        self.chunk = self.new_buffer()
+
+    def encode(self, value):
+        self.chunk.write(tweetjson.dumps_line(value))
@@ -0,0 +1,109 @@
+import json
+import os
+import re
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Stream payloads start with the same top-level fields, in this order:
+#   {"created_at":"...","id":123,"id_str":"123","text":"...", ... "user":{...}, ...}
+# so the fields parse_payload needs can be read off the head of the payload
+# without decoding the user object, entities and embedded tweets after them.
+HEAD = re.compile(r'\s*\{\s*"created_at"\s*:\s*"([^"\\]*)"\s*,\s*"id"\s*:\s*(\d+)\s*,'
+                  r'\s*"id_str"\s*:\s*"\d*"\s*,\s*"text"\s*:\s*("[^"\\]*(?:\\.[^"\\]*)*")')
+TWEET_ID = re.compile(r'\s*\{\s*"created_at"\s*:\s*"[^"\\]*"\s*,\s*"id"\s*:\s*(\d+)')
+
+
+class StdlibJson():
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, value):
+        return json.dumps(value)
+
+    def dumps_line(self, value):
+        return (json.dumps(value) + '\n').encode('utf-8')
+
+
+class OrjsonJson(StdlibJson):
+    # compact UTF-8 output; anything orjson refuses (non-str keys, ints over
+    # 64 bits) goes through the stdlib encoder instead
+    name = 'orjson'
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, value):
+        return self.dumps_line(value)[:-1].decode('utf-8')
+
+    def dumps_line(self, value):
+        try:
+            return orjson.dumps(value, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().dumps_line(value)
+
+
+BACKENDS = {'json': StdlibJson}
+if orjson is not None:
+    BACKENDS['orjson'] = OrjsonJson
+
+
+def get_backend(name=None):
+    # JSON_BACKEND picks one explicitly, otherwise the fastest installed
+    name = name or os.environ.get('JSON_BACKEND') or ('orjson' if 'orjson' in BACKENDS else 'json')
+    if name not in BACKENDS:
+        raise ValueError(f'JSON backend {name} is not available')
+    return BACKENDS[name]()
+
+
+backend = get_backend()
+loads = backend.loads
+dumps = backend.dumps
+dumps_line = backend.dumps_line
+
+
+def decode(raw_data):
+    # the tweet dict, or None for control messages (limit, delete, warning...)
+    # and anything else without created_at, id and text
+    if '"created_at"' not in raw_data:
+        return None
+    tweet = loads(raw_data)
+    if not isinstance(tweet, dict) or 'created_at' not in tweet or 'id' not in tweet or 'text' not in tweet:
+        return None
+    return tweet
+
+
+def decode_head(raw_data):
+    # (id, created_at, text) of a tweet payload, or None
+    match = HEAD.match(raw_data)
+    if match:
+        return int(match.group(2)), match.group(1), json.loads(match.group(3))
+    tweet = decode(raw_data)
+    if tweet is None:
+        return None
+    return tweet['id'], tweet['created_at'], tweet['text']
+
+
+def tweet_id(raw_data):
+    # the id of a tweet payload, or None; cheap enough to run before parsing
+    match = TWEET_ID.match(raw_data)
+    if match:
+        return int(match.group(1))
+    tweet = decode(raw_data)
+    if tweet is None:
+        return None
+    return tweet['id']
+
+
+@lru_cache(maxsize=4096)
+def format_date(created_at):
+    # 'Fri Dec 24 18:00:00 +0000 2021' -> '2021-12-24 18:00:00'; a busy
+    # stream repeats the same second many times
+    return parsedate_to_datetime(created_at).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+
+
+class UploadState():
+    # Content hashes of the last uploaded profile image and banner, so an
+    # hourly run can skip uploads that would not change anything.
+    def __init__(self, path='upload_state.json'):
+        self.path = path
+        self.hashes = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.hashes = json.load(f)
+            except Exception as e:
+                print(e)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def changed(self, key, data):
+        return self.hashes.get(key) != self.digest(data)
+
+    def record(self, key, data):
+        self.hashes[key] = self.digest(data)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp, self.path)
+
+    def upload(self, key, f, upload, force=False):
+        # upload(f) is only called when the content differs from the last
+        # recorded upload, or when forced. Returns whether it was called.
+        data = f.read()
+        f.seek(0)
+        if not force and not self.changed(key, data):
+            print(f'{key} unchanged, skipping upload')
+            return False
+        upload(f)
+        self.record(key, data)
+        return True